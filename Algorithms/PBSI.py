@@ -21,103 +21,237 @@
     THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 """
 
+import hashlib
 import numpy as np
+import multiprocessing as mp
+import scipy.sparse as sps
+from scipy.sparse.csgraph import connected_components
+from igraph import Graph
 import SprModel.Utilities as ut
-import operator
-from collections import deque, OrderedDict
+from collections import deque
+from functools import reduce
+from math import gcd
+from SprModel.CSRGraph import CSRGraph, csrFromEdges, adjacencyMatrix
+from .Partitions import PARTITIONERS, partition
 import time  
+import weakref
 
 
-def _checkCommunities(g_comm, clusters, policy_tag):
-    g = g_comm
-    comm_size = len(clusters)
-    for i in range(comm_size):
-        _inc = 'A'
-        sub = clusters.subgraph(i)
-        components = list(sub.components())
-        if len(components) == 1:
-            continue
-        else:
-            print ("Community: " + sub.vs[0][policy_tag] + 'broken into ' + str(len(components)) + " communities")
-            for comp in components:
-                for v_sub in comp:
-                    v = g.vs.find(name=sub.vs[v_sub]['name'])
-                    v[policy_tag] = v[policy_tag][:-1]+_inc+"]"
-                _inc = ut.inc_char(_inc)
-
-
-def __getNeighbors(v, r=3):
-    r_max = r
-    r=0
-    Q1 = deque() 
-    Q2 = deque()
-    distance = OrderedDict()
-    Q1.append(v)
-    distance[v] = 0
-    for r in range(r_max):
-        while len(Q1) != 0:
-            _v = Q1.popleft()
-            neis = _v.neighbors()
-            for w in neis:
-                if not distance.has_key(w):
-                    Q2.append(w)
-                    distance[w] = distance[_v] + 1 
-        tmp = Q1
-        Q1 = Q2
-        Q2 = tmp        
-    distance.pop(v)
-    return distance
-
-
-def __G(g, X):
-    gX = [None]*len(g.vs)
-    for v in g.vs:
-        _sum = 0
-        neis = __getNeighbors(v)
-        for w in neis.keys():
-            _sum += float(v[X] * w[X]) / pow(neis[w],2)
-        gX[v.index] = _sum
-    return gX
-
-
-def checkPrepareCommunities(g, c_name=None):
+def _checkCommunities(g, membership, policy_tag):
+    '''
+    split every community of membership that is not connected into its components: the
+    components of the graph made of the intra-community edges are labeled in one pass and
+    ranked inside their community by lowest vertex id. Returns the refined membership as
+    integer ids and sets policy_tag to the "[component-community]" labels, the parts of a
+    split community suffixed A, B, ...
+    '''
+    N = len(g.vs)
+    membership = np.asarray(membership, dtype=np.int64)
+    edges = np.array(g.get_edgelist(), dtype=np.int64).reshape(-1, 2)
+    edges = edges[membership[edges[:,0]] == membership[edges[:,1]]]
+    A = sps.csr_matrix((np.ones(len(edges), dtype=np.int8), (edges[:,0], edges[:,1])), shape=(N, N))
+    n_parts, part = connected_components(A, directed=False)
+    
+    first = np.full(n_parts, N, dtype=np.int64)
+    np.minimum.at(first, part, np.arange(N))
+    comm = membership[first]
+    order = np.lexsort((first, comm))
+    rank = np.empty(n_parts, dtype=np.int64)
+    rank[order] = np.arange(n_parts) - np.searchsorted(comm[order], comm[order])
+    parts = np.bincount(comm)[comm]
+    refined = np.empty(n_parts, dtype=np.int64)
+    refined[order] = np.arange(n_parts)
+    
+    components = g.components().membership
+    labels = ["["+str(components[i])+"-"+str(membership[i])+"]" for i in range(N)]
+    for p in order[((rank == 0) & (parts > 1))[order]]:
+        print ("Community: " + labels[first[p]] + 'broken into ' + str(parts[p]) + " communities")
+    suffix = (parts > 1)[part]
+    for i, r in zip(np.flatnonzero(suffix).tolist(), rank[part[suffix]].tolist()):
+        labels[i] = labels[i][:-1] + chr(ord('A') + r) + "]"
+    g.vs[policy_tag] = labels
+    return refined[part]
+
+
+def _gravity(indptr, indices, x, r=3, batch=None):
+    '''
+    gravity index sum_{0 < d(v,w) <= r} x_v * x_w / d(v,w)^2 of every vertex; the distance
+    shells come from a level-synchronous BFS run for a batch of sources at a time, as
+    sparse frontier x adjacency products
+    '''
+    N = len(x)
+    x = np.asarray(x, dtype=float)
+    A = adjacencyMatrix(indptr, indices)
+    if batch is None:
+        batch = max(1, 2**24 // max(N, 1))
+    # shell sums are weighted by L/d^2 (integers) and divided by L once, so that
+    # integral x (coreness) gives the exact sum up to a single rounding
+    L = reduce(lambda a, b: a * b // gcd(a, b), range(1, r+1), 1)**2
+    weights = [L // d**2 for d in range(1, r+1)]
+    
+    total = np.zeros(N)
+    for start in range(0, N, batch):
+        sources = np.arange(start, min(start + batch, N))
+        B = len(sources)
+        rows = np.arange(B)
+        visited = np.zeros((B, N), dtype=bool)
+        visited[rows, sources] = True
+        F = sps.csr_matrix((np.ones(B, dtype=np.int32), (rows, sources)), shape=(B, N))
+        for d in range(r):
+            P = (F * A).tocoo()
+            new = ~visited[P.row, P.col]
+            rows_d, cols_d = P.row[new], P.col[new]
+            visited[rows_d, cols_d] = True
+            total[sources] += weights[d] * np.bincount(rows_d, weights=x[cols_d], minlength=B)
+            F = sps.csr_matrix((np.ones(len(rows_d), dtype=np.int32), (rows_d, cols_d)), shape=(B, N))
+    return x * total / L
+
+
+def gravityScores(G, X, r=3):
+    '''
+    gravity index of every vertex of the CSRGraph G for the column (or array) X
+    '''
+    x = G[X] if isinstance(X, str) else X
+    return _gravity(*G.csr(), x=x, r=r)
+
+
+def __G(g, X, r=3):
+    return gravityScores(CSRGraph(g), X, r).tolist()
+
+
+def _subgraphGravity(task):
+    '''
+    coreness-based gravity of one community, given as (n, src, dst) local edge arrays
+    '''
+    n, src, dst, r = task
+    ks = Graph(n=n, edges=list(zip(src.tolist(), dst.tolist()))).coreness(mode='ALL')
+    return _gravity(*(csrFromEdges(n, src, dst) + (ks, r)))
+
+
+def _communitiesGravity(g, c_name, r=3, workers=1):
+    '''
+    gravity of every vertex within the subgraph induced by its community; communities are
+    sent to the pool as local edge arrays, largest first
+    '''
+    _, labels = np.unique(g.vs[c_name], return_inverse=True)
+    members = np.argsort(labels, kind='stable')
+    sizes = np.bincount(labels)
+    offsets = np.concatenate(([0], np.cumsum(sizes)))
+    local = np.empty(len(labels), dtype=np.int64)
+    local[members] = np.arange(len(labels)) - offsets[labels[members]]
+    
+    edges = np.array(g.get_edgelist(), dtype=np.int64).reshape(-1, 2)
+    edges = edges[labels[edges[:,0]] == labels[edges[:,1]]]
+    edges = edges[np.argsort(labels[edges[:,0]], kind='stable')]
+    e_offsets = np.concatenate(([0], np.cumsum(np.bincount(labels[edges[:,0]], minlength=len(sizes)))))
+    
+    comm = sorted(range(len(sizes)), key=lambda c: (sizes[c] + e_offsets[c+1] - e_offsets[c]), reverse=True)
+    tasks = [(sizes[c], local[edges[e_offsets[c]:e_offsets[c+1], 0]], local[edges[e_offsets[c]:e_offsets[c+1], 1]], r) for c in comm]
+    if workers > 1:
+        pool = mp.Pool(workers)
+        try:
+            results = pool.map(_subgraphGravity, tasks, chunksize=1)
+        finally:
+            pool.terminate()
+            pool.join()
+    else:
+        results = map(_subgraphGravity, tasks)
+    
+    gks = np.empty(len(labels))
+    for c, res in zip(comm, results):
+        gks[members[offsets[c]:offsets[c+1]]] = res
+    return gks.tolist()
+
+
+def checkPrepareCommunities(g, c_name=None, radius=3, workers=1, alg='multilevel', params=None, store=None):
+    '''
+    make sure g has the community attribute c_name (found by the partitioner alg, see
+    Partitions, with disconnected communities split) and its gravity attribute 'gks_'+c_name.
+    With a PartitionStore the partition is reused across runs and stored with its build time
+    '''
     if c_name == None:
-        c_name = 'MLC'
+        c_name = PARTITIONERS[alg][1]
     
     if c_name not in g.vs.attribute_names():
-        components = g.components()
-        components = components.membership
-        
-        clusters = g.community_multilevel()
-        membership = clusters.membership
-        membership = ["["+str(components[i])+"-"+str(membership[i])+"]" for i in range(len(membership)) ]
-        g.vs[c_name] = membership # get the membership vector
-        _checkCommunities(g, clusters, c_name)
-    
-    communities = {c:0 for c in set(g.vs[c_name])}
-    for v in g.vs:
-        communities[ v[c_name] ] += 1
-    sorted_comm = sorted(communities.items(), key=operator.itemgetter(1), reverse=False)
-    comm, _ = zip(*sorted_comm)
+        key = store.key(g, alg, params) if store is not None else None
+        entry = store.load(key) if store is not None else None
+        if entry is None:
+            start_time = time.time()
+            membership = partition(g, alg, params)
+            split_time = time.time()
+            refined = _checkCommunities(g, membership, c_name)
+            entry = {'membership': np.array(membership), 'labels': np.array(g.vs[c_name]), 'refined': refined,
+                     'time': split_time - start_time, 'split_time': time.time() - split_time}
+            if store is not None:
+                store.store(key, entry)
+        else:
+            g.vs[c_name] = entry['labels'].tolist()
     
     if 'gks_'+c_name not in set(g.vs.attribute_names()):
-        g.vs['gks_'+c_name] = None
-        for c in comm:
-            topics = g.vs.select(lambda x:x[c_name] == c)#['label']
-            
-            sub_g = g.subgraph(topics.indices)
-            ks = sub_g.coreness(mode='ALL')
-            sub_g.vs['ks'] = ks
-            
-            gks = __G(sub_g, 'ks')
-            sub_g.vs['gks_'+c_name] = gks
-            
-            for v in sub_g.vs:
-                w = g.vs.select(name=v['name'])
-                w['gks_'+c_name] = v['gks_'+c_name]
+        g.vs['gks_'+c_name] = _communitiesGravity(g, c_name, radius, workers)
     return c_name, 'gks_'+c_name
 
 
+class CommunityIndex:
+    '''
+    vertices bucketed by their community (attribute alg); within a bucket they are sorted
+    by decreasing gks_name (ties by vertex id), or by vertex id when gks_name is None.
+    Communities are pre-sorted by increasing size and by increasing top gravity
+    '''
+    def __init__(self, g, alg, gks_name=None):
+        labels, comm_of = np.unique(g.vs[alg], return_inverse=True)
+        self.labels = labels.tolist()
+        self.ids = {c: i for i, c in enumerate(self.labels)}
+        self.sizes = np.bincount(comm_of, minlength=len(self.labels))
+        self.offsets = np.concatenate(([0], np.cumsum(self.sizes)))
+        self.by_size = np.argsort(self.sizes, kind='stable')
+        if gks_name is None:
+            self.order = np.argsort(comm_of, kind='stable')
+            self.by_gks = None
+        else:
+            gks = np.asarray(g.vs[gks_name], dtype=float)
+            self.order = np.lexsort((np.arange(len(gks)), -gks, comm_of))
+            self.by_gks = np.argsort(gks[self.order[self.offsets[:-1]]], kind='stable')
+    
+    def top(self, c, k=None):
+        end = self.offsets[c+1] if k is None else min(self.offsets[c] + k, self.offsets[c+1])
+        return self.order[self.offsets[c]:end].tolist()
+
+
+_comm_index = {}
+
+def _graphCache(g):
+    key = id(g)
+    if key not in _comm_index:
+        _comm_index[key] = {}
+        weakref.finalize(g, _comm_index.pop, key, None)
+    return _comm_index[key]
+
+
+def _columnsHash(g, names):
+    '''
+    content hash of the vertex attributes names of g
+    '''
+    h = hashlib.sha1()
+    for name in names:
+        column = np.asarray(g.vs[name])
+        h.update(str(column.dtype).encode())
+        h.update(column.tobytes() if column.dtype != object else repr(column.tolist()).encode())
+    return h.hexdigest()
+
+
+def communityIndex(g, alg, gks_name=None, rebuild=False):
+    '''
+    CommunityIndex of g, kept with the graph and rebuilt when the community or gravity
+    attribute changed since it was built (checked by content), or when rebuild is requested
+    '''
+    cache = _graphCache(g)
+    key = _columnsHash(g, [alg] if gks_name is None else [alg, gks_name])
+    if rebuild or cache.get((alg, gks_name), (None,))[0] != key:
+        cache[(alg, gks_name)] = (key, CommunityIndex(g, alg, gks_name))
+    return cache[(alg, gks_name)][1]
+
+
 def deflatSpreaders(spr):
     final_local = []
     rows = len(spr)
@@ -138,28 +272,9 @@ def deflatSpreaders(spr):
     return final_local
 
 
-def detectSpreaders(g, max_spreaders, alg, commSet = None):
-    gks_name = 'gks_'+alg
-    comms_set = set(g.vs[alg])
-    
-    if commSet:
-        comm = commSet[0]
-        communities = commSet[1]
-    else:
-        communities = {c:0 for c in comms_set }
-        for v in g.vs:
-            if max_spreaders < len(comms_set):
-                communities[ v[alg] ] = max(communities[ v[alg] ], v[gks_name])
-            else:
-                communities[ v[alg] ] += 1
-        
-        sorted_comm = sorted(communities.items(), key=operator.itemgetter(1), reverse=False)
-        comm, _ = zip(*sorted_comm)
-    
-    V = len(g.vs)
+def _selectSpreaders(index, V, max_spreaders, comm, communities):
     spread_done = 0
     nodes_done = 0
-    g.vs['PRP'] = 0
     spr = []
     
     if max_spreaders < len(comm):
@@ -168,29 +283,55 @@ def detectSpreaders(g, max_spreaders, alg, commSet = None):
         comm = comm[:max_spreaders]
         
         for c in comm: 
-            topics = g.vs.select(lambda x:x[alg] == c)
-            vertices = list(topics)
-            vertices.sort(key = lambda v: v[gks_name], reverse=True)
-            spr.append( deque(vertices[:1]) )
+            spr.append( deque(index.top(c, 1)) )
     else:
         for c in comm:
-            topics = g.vs.select(lambda x:x[alg] == c)
-            vertices = list(topics)
-            vertices.sort(key = lambda v: v[gks_name], reverse=True)
-            k = communities[c] * (max_spreaders-spread_done) / float(V-nodes_done)
+            k = int(communities[c]) * (max_spreaders-spread_done) / float(V-nodes_done)
             if k < 1:
                 k=1
             else:
                 k = int(round(k,0))
             spread_done += k
-            nodes_done += communities[c]
-            vertices = vertices[:k]
+            nodes_done += int(communities[c])
             
-            spr.append( deque(vertices) )
+            spr.append( deque(index.top(c, k)) )
         spr.reverse()
-    spr2 = deflatSpreaders(spr)
-    i = max_spreaders
-    for v in spr2:
-        v['PRP'] = i
-        i-=1 
-    return spr2
+    return deflatSpreaders(spr)
+
+
+def _communityOrder(index, max_spreaders, commSet):
+    if commSet:
+        comm = [index.ids[c] for c in commSet[0]]
+        communities = {index.ids[c]: n for c, n in commSet[1].items()}
+    else:
+        if max_spreaders < len(index.labels):
+            comm = index.by_gks
+        else:
+            comm = index.by_size
+        communities = index.sizes
+    return comm, communities
+
+
+def detectSpreaders(g, max_spreaders, alg, commSet = None):
+    index = communityIndex(g, alg, 'gks_'+alg)
+    comm, communities = _communityOrder(index, max_spreaders, commSet)
+    spr2 = _selectSpreaders(index, len(g.vs), max_spreaders, comm, communities)
+    g.vs['PRP'] = 0
+    ut.setAttribute(g, 'PRP', spr2, range(max_spreaders, max_spreaders - len(spr2), -1))
+    return [g.vs[v] for v in spr2]
+
+
+def detectSpreadersMulti(g, budgets, alg, commSet = None):
+    '''
+    spreaders detected for every budget in budgets, sharing the community index; returns
+    the vertex ids of all selections in one array plus offsets, selection i being
+    spr[offsets[i]:offsets[i+1]]. The PRP attribute is left untouched
+    '''
+    index = communityIndex(g, alg, 'gks_'+alg)
+    spr = []
+    offsets = [0]
+    for max_spreaders in budgets:
+        comm, communities = _communityOrder(index, int(max_spreaders), commSet)
+        spr.extend( _selectSpreaders(index, len(g.vs), int(max_spreaders), comm, communities) )
+        offsets.append(len(spr))
+    return np.array(spr, dtype=np.int64), np.array(offsets, dtype=np.int64)
@@ -0,0 +1,88 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+
+"""
+    Copyright (c) 2021, Jedidiah Yanez-Sierra, Cinvestav-Guadalajara
+    All rights reserved.
+    Redistribution and use in source and binary forms, with or without modification, are permitted provided that the
+    following conditions are met:
+    * Redistributions of source code must retain the above copyright notice, this list of conditions and the following
+      disclaimer.
+    * Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the
+      following disclaimer in the documentation and/or other materials provided with the distribution.
+    * Neither the name of Cinvestav-Guadalajara nor the names of its contributors may be used to endorse or
+      promote products derived from this software without specific prior written permission.
+    THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+    INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+    DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+    SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+    SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+    WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF
+    THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import os
+import pickle
+import hashlib
+from SprModel.Utilities import graphFingerprint
+
+
+# community detection methods: igraph call returning the membership list, the vertex
+# attribute its communities are stored in and the default parameters
+PARTITIONERS = {
+    'multilevel': (lambda g, **kw: g.community_multilevel(**kw).membership, 'MLC', {}),
+    'leiden': (lambda g, **kw: g.community_leiden(**kw).membership, 'LDC', {'objective_function': 'modularity'}),
+    'label_propagation': (lambda g, **kw: g.community_label_propagation(**kw).membership, 'LPC', {}),
+    'fastgreedy': (lambda g, **kw: g.community_fastgreedy(**kw).as_clustering().membership, 'FGC', {}),
+}
+
+
+def partitionParams(alg, params=None):
+    '''
+    parameters of a partitioner run, its defaults updated with params
+    '''
+    if alg not in PARTITIONERS:
+        raise ValueError('unknown partitioner ' + str(alg) + ', one of ' + ', '.join(sorted(PARTITIONERS)))
+    kw = dict(PARTITIONERS[alg][2])
+    kw.update(params or {})
+    return kw
+
+
+def partition(g, alg='multilevel', params=None):
+    return PARTITIONERS[alg][0](g, **partitionParams(alg, params))
+
+
+class PartitionStore:
+    '''
+    persistent community partitions, one file per (graph fingerprint, partitioner, parameters)
+    in path. An entry is a dict with the partitioner membership ('membership'), the community
+    labels once disconnected communities are split ('labels', 'refined' as integer ids) and
+    the build times in seconds ('time', 'split_time')
+    '''
+    def __init__(self, path):
+        self.path = path
+        if not os.path.isdir(path):
+            os.makedirs(path)
+    
+    def key(self, g, alg, params=None):
+        '''
+        the topology is hashed on every call, so a graph edited in place gets new keys
+        '''
+        params = sorted(partitionParams(alg, params).items())
+        return hashlib.sha1(repr((graphFingerprint(g), alg, params)).encode()).hexdigest()
+    
+    def _file(self, key):
+        return os.path.join(self.path, key + '.pkl')
+    
+    def load(self, key):
+        path = self._file(key)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+    
+    def store(self, key, entry):
+        path = self._file(key)
+        with open(path + '.tmp', 'wb') as f:
+            pickle.dump(entry, f, protocol=2)
+        os.replace(path + '.tmp', path)
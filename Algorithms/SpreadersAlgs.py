@@ -22,149 +22,186 @@
 """
 
 import time 
+import heapq
 import numpy as np
-from math import log
-from igraph import VertexClustering
+from SprModel.CSRGraph import CSRGraph, eccentricity
 
 
-def HybridRank(g, attr=None, directed=True):
-    if directed:
-        mode = 'IN'
+def hybridRankScores(G, mode='ALL', attr=None, eps=0., samples=None, random_seed=None):
+    '''
+    HC = ECC * ICC on the CSRGraph G, ICC being the sum of the neighbors coreness (or the
+    column attr). Undirected eccentricities (or mode ALL) come from the bounding engine in
+    CSRGraph, eps>0 switches it to the sampled approximation; directed ones fall back to
+    igraph. Sets the columns ECC, ICC and HC of G and returns HC
+    '''
+    if mode == 'ALL' or not G.directed:
+        ecc, _ = eccentricity(*G.csr(mode), eps=eps, samples=samples, random_seed=random_seed)
+        G['ECC'] = ecc.astype(float)
     else:
-        mode = 'ALL'
+        G['ECC'] = np.array(G.graph().eccentricity(mode=mode), dtype=float)
     
-    g.vs['ECC'] = g.eccentricity(mode=mode)
     if attr==None:
         attr='ICC'
-        g.vs[attr] = 0
-        g.vs['KS'] = g.coreness(mode=mode)
-        
-        for v in g.vs:
-            for w in v.neighbors(mode=mode):
-                v[attr] += w['KS']
-        del g.vs['KS']
+        G[attr] = G.adjacency(mode, dtype=np.int64) * G.coreness(mode)
     
-    g.vs['HC'] = 0
-    for v in g.vs:
-        v['HC'] = v['ECC'] * v[attr]
+    G['HC'] = G['ECC'] * G[attr]
+    return G['HC']
+
+
+def HybridRank(g, attr=None, directed=True, eps=0., samples=None, random_seed=None):
+    G = CSRGraph(g)
+    hybridRankScores(G, 'IN' if directed else 'ALL', attr, eps, samples, random_seed)
+    G.sync()
     return g.vs['HC']
 
 
-def voteRank(g, directed=True, f=None, r=1):
-    g.vs['s'] = 0
-    g.vs['va'] = 1
-    g.vs['VR'] = 0
-    if f == None:
-        f = 1.0 / np.average(g.degree())
+def _voteRank(in_csr, out_csr, f, r):
+    '''
+    VoteRank over CSR adjacencies, votes are kept in arrays and candidates in a lazy
+    max-heap; after a pick only the voting ability of the spreader and its neighbors
+    changes, so only the nodes they vote for are re-scored. Returns the spreaders in pick
+    order and their scores
+    '''
+    in_ptr, in_idx = in_csr
+    out_ptr, out_idx = out_csr
+    N = len(in_ptr) - 1
+    va = np.ones(N)
+    s = np.diff(in_ptr).astype(float)
+    selected = np.zeros(N, dtype=bool)
+    heap = list(zip((-s).tolist(), range(N)))
+    heapq.heapify(heap)
     
     spr = []
-    spr_set = set()
-    if directed:
-        mode = 'IN'
-    else:
-        mode = 'ALL'
-    
-    times = list()
-    while(len(spr) < r):
-        max_v = None
-        max_s = 0
-        
-        start_time = time.time()
-        #vote phase, each node is voted by its incoming neighbors
-        g.vs['s'] = 0 
-        for v in g.vs:
-            neighs = v.neighbors(mode=mode)
-            for w in neighs:
-                v['s'] += w['va']
-        
-            #keep track of most voted node
-            if v['s'] > max_s and v not in spr_set:
-                max_s = v['s'] 
-                max_v = v
-        if max_v == None:
+    scores = []
+    while len(spr) < r:
+        while heap and (selected[heap[0][1]] or -heap[0][0] != s[heap[0][1]]):
+            heapq.heappop(heap)
+        if not heap or heap[0][0] >= 0:
             break
-        spr.append((max_v,max_v['s']))
-        spr_set.add(max_v)
-        max_v['va'] = 0
-        max_v['s'] = 0
+        max_s, max_v = heapq.heappop(heap)
+        spr.append(max_v)
+        scores.append(-max_s)
+        selected[max_v] = True
+        va[max_v] = 0
         
         #Weaken the voting ability of neighbors of max_v
-        neighs = max_v.neighbors(mode=mode)
-        for w in neighs:
-            w['va'] = max(w['va'] - f, 0)
-    
-    del g.vs['s']
-    del g.vs['va']
-    for v, val in spr:
-        v['VR'] = val
+        neighs = in_idx[in_ptr[max_v]:in_ptr[max_v+1]]
+        for w in neighs.tolist():
+            va[w] = max(va[w] - f, 0)
+        
+        #re-vote the nodes whose voters changed, summing in neighbor order
+        voters = np.append(neighs, max_v)
+        affected = np.unique(np.concatenate([out_idx[out_ptr[w]:out_ptr[w+1]] for w in voters]))
+        for v in affected[~selected[affected]].tolist():
+            s[v] = sum(va[in_idx[in_ptr[v]:in_ptr[v+1]]].tolist())
+            heapq.heappush(heap, (-s[v], v))
+    return spr, scores
+
+
+def voteRankScores(G, directed=True, f=None, r=1):
+    '''
+    VoteRank on the CSRGraph G: spreaders in pick order with their scores; the first k of a
+    run with r >= k are the spreaders of a run with r = k. Sets the column VR of G (the
+    score of the spreaders, 0 elsewhere)
+    '''
+    if f == None:
+        f = 1.0 / np.average(G.degree())
+    if directed:
+        spr, scores = _voteRank(G.csr('IN'), G.csr('OUT'), f, r)
+    else:
+        spr, scores = _voteRank(G.csr('ALL'), G.csr('ALL'), f, r)
+    VR = np.zeros(G.N)
+    VR[spr] = scores
+    G['VR'] = VR
+    return spr, scores
+
+
+def voteRankOrder(g, directed=True, f=None, r=1):
+    return voteRankScores(CSRGraph(g), directed, f, r)
+
+
+def voteRank(g, directed=True, f=None, r=1):
+    G = CSRGraph(g)
+    voteRankScores(G, directed, f, r)
+    G.sync()
     return g.vs['VR']
 
 
+def iksScores(G):
+    '''
+    IKS entropy on the CSRGraph G, iks_e(v) = -sum_{w in N(v)} I_w + log(I_w) with
+    I_w = k_w / sum(k), as one sparse product of the adjacency matrix and the per node
+    terms. Sets the columns iks_kcore and iks_e of G
+    '''
+    deg = G.degree()
+    I = deg / float(deg.sum())
+    t = np.zeros(len(I))
+    t[I > 0] = I[I > 0] + np.log(I[I > 0])
+    G['iks_kcore'] = G.coreness()
+    G['iks_e'] = -(G.adjacency(dtype=float) * t)
+    return G['iks_e']
+
+
+def iksSelectOrder(G, N):
+    '''
+    round-robin over the k-shells (highest kcore first) taking the node of largest entropy
+    left in each shell, ties to the highest index. Picking rounds are sorted at once: shells
+    come from a single sort on (kcore, entropy) and pick i of shell j precedes pick i+1 of any
+    shell. Sets the column IKS of G (N + 1 - pick position, 0 elsewhere)
+    '''
+    kcore = np.asarray(G['iks_kcore'])
+    iks_e = np.asarray(G['iks_e'], dtype=float)
+    ids = np.arange(len(kcore))
+    order = np.lexsort((-ids, -iks_e, -kcore))
+    k = kcore[order]
+    start = np.r_[True, k[1:] != k[:-1]]
+    shell = np.cumsum(start) - 1
+    pos = ids - np.flatnonzero(start)[shell]
+    
+    N = min(N, G.N)
+    spr = order[np.lexsort((shell, pos))[:N]]
+    IKS = np.zeros(G.N, dtype=np.int64)
+    IKS[spr] = N + 1 - np.arange(N)
+    G['IKS'] = IKS
+    return spr
+
+
 def IKS(g, directed=True):
-    k_N = float(sum(g.vs.degree()))
-    g.vs['iks_kcore'] = g.coreness(mode='All')
-    g.vs['iks_e'] = 0
-    for v in g.vs:
-        e_v = 0
-        for w in v.neighbors():
-            I_w = w.degree() / k_N
-            e_v += I_w + log(I_w)
-        v['iks_e'] = -e_v
+    G = CSRGraph(g)
+    iksScores(G)
+    G.sync()
 
 
 def IKS_Select(g, N):
-    g.vs['IKS']=0
-    clust = VertexClustering.FromAttribute(g, 'iks_kcore')
-    subg_clust = clust.subgraphs()
-    subg_clust.sort(key=lambda x:x.vs[0]['iks_kcore'], reverse=True) #sort by k-shell
-    subg_clust = [list(sub_g.vs) for sub_g in subg_clust] #change from graph to list of vertexes
-    for k_vs in subg_clust:
-        k_vs.sort(key=lambda x:x['iks_e']) 
-    N = min(N,len(g.vs))
-    kcore_size = len(subg_clust)
-    k = 0
-    spr = []
-    while len(spr) < N:
-        j = k % kcore_size
-        k += 1
-        if(len(subg_clust[j])==0):
-            continue
-        else:
-            v = subg_clust[j].pop()
-            v = g.vs.find(name=v['name'])
-            v['IKS'] = N + 1 - len(spr)
-            spr.append( v )        
-    return spr
+    G = CSRGraph(g)
+    spr = iksSelectOrder(G, N)
+    G.sync()
+    return [g.vs[v] for v in spr.tolist()]
 
 
-def s_k_w_out(v,w):
-    neigh_v = set(v.neighbors())
-    neigh_v.add(v)
-    neigh_w = set(w.neighbors())
-    k_w_out = len(neigh_w-neigh_v)
-    return k_w_out
+def scCoreScores(G, alpha):
+    '''
+    sc_score(v) = sum_{w in N(v)} 1 + k_w_out * (1 + D_vw/2^2)^alpha on the CSRGraph G,
+    where D_vw is the number of common neighbors of v and w (read from A*A on the edges) and
+    k_w_out = deg(w) - D_vw - 1 the neighbors of w outside the closed neighborhood of v.
+    Sets the column sc_score of G
+    '''
+    A = G.adjacency().copy()
+    A.sum_duplicates()
+    A.data[:] = 1
+    deg = np.diff(A.indptr)
+    
+    X = (A.multiply(A * A) + A).tocsr()
+    X.sort_indices()
+    rows = np.repeat(np.arange(G.N), np.diff(X.indptr))
+    D_vw = X.data - 1.0
+    k_w_out = deg[X.indices] - D_vw - 1
+    w_score = 1 + k_w_out * (1 + D_vw/float(2**2))**alpha
+    G['sc_score'] = np.bincount(rows, weights=w_score, minlength=G.N)
+    return G['sc_score']
 
 
 def sc_core(g,alpha):
-    g.es['w_score'] = [{}]*len(g.es)
-    for e in g.es:
-        v = g.vs[e.source]
-        w = g.vs[e.target]
-        D_vw = g.get_all_simple_paths(v.index,w.index,cutoff=2, mode='ALL')
-        D_vw = len(D_vw)-1 #sum( [1 for x in D_vw if len(x)==3] )
-        
-        k_w_out = s_k_w_out(v,w)
-        e['w_score']["%d,%d"%(v.index, w.index)] = 1 + k_w_out * (1 + D_vw/float(2**2))**alpha
-        
-        w = g.vs[e.source]
-        v = g.vs[e.target]
-        k_w_out = s_k_w_out(v,w)
-        e['w_score']["%d,%d"%(v.index, w.index)] = 1 + k_w_out * (1 + D_vw/float(2**2))**alpha
-    
-    g.vs['sc_score']=0
-    for v in g.vs:
-        s = 0
-        for w in v.neighbors():
-            eid = g.get_eid(v, w, directed=False, error=True)
-            s += g.es[eid]['w_score']["%d,%d"%(v.index, w.index)]
-        v['sc_score'] = s
+    G = CSRGraph(g)
+    scCoreScores(G, alpha)
+    G.sync()
@@ -21,5 +21,7 @@
     THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 """
 
-from .PBSI import detectSpreaders, checkPrepareCommunities
-from .SpreadersAlgs import HybridRank, voteRank, IKS, IKS_Select, sc_core
\ No newline at end of file
+from .PBSI import detectSpreaders, detectSpreadersMulti, checkPrepareCommunities, gravityScores
+from .Partitions import PartitionStore, partition
+from .SpreadersAlgs import HybridRank, voteRank, IKS, IKS_Select, sc_core
+from .SpreadersAlgs import hybridRankScores, voteRankScores, iksScores, iksSelectOrder, scCoreScores
\ No newline at end of file
@@ -25,74 +25,66 @@ import os
 import time
 import argparse
 import numpy as np 
-import matplotlib; 
-matplotlib.use('agg')
-import matplotlib.pyplot as plt
 import SprModel.Utilities as ut
-from SprModel.SIR import sim_SIR
+from SprModel.SIRCache import SIRCache
+from SprModel.MetricStore import MetricStore
+from SprModel.Ranking import topK
 from Algorithms.PBSI import detectSpreaders, checkPrepareCommunities
+from Algorithms.Partitions import PartitionStore, PARTITIONERS
 from Algorithms.SpreadersAlgs import voteRank, HybridRank, IKS, IKS_Select, sc_core
+from ExpRunner import Task, runTasks, saveResults, finish
 
 
-def plot(fig, data, keys=[], names=[], title="", xylabels=['',''], flag=True, vline=None):
-    ymax = 0
-    for k in keys:
-        fig.plot(data[k][0], data[k][1], data[k][2], markersize=1)
-        ymax = max(ymax, max(data[k][1]))
-    if flag:
-        fig.set_title(title, fontsize=12)
-        fig.set_xlabel(xylabels[0], fontsize=10)
-        fig.set_ylabel(xylabels[1], fontsize=10)
-        fig.legend(names, fontsize=10, loc=7)
-        fig.grid()
-    if vline:
-        fig.vlines(vline, 0, ymax, colors='k', linestyles='dashed')
-
-
-def calculateMetrics(g,  g_path, metrics, spr_size, weight_attr=None):
+def calculateMetrics(g,  g_path, metrics, spr_size, weight_attr=None, partitioner='multilevel'):
+    store = MetricStore(g, g_path)
+    store.attach(g)
     g_attr = set(g.vs.attribute_names())
-    times = {metric:0 for metric in metrics}
+    times = {metric:store.time(metric) for metric in metrics}
     if 'BET' in metrics and 'BET' not in g_attr:
         print ('Computing Betweenness, this process could be time consuming...')
         start_time = time.time()
         g.vs['BET'] = g.betweenness(directed=False, weights=weight_attr)
         times['BET'] = time.time() - start_time
-        ut.saveGraph(g, g_path)
+        store.save('BET', g.vs['BET'], times['BET'])
     
     if 'CLO' in metrics and 'CLO' not in g_attr:
         print ('Computing Closeness...')
         start_time = time.time()
         g.vs['CLO'] = g.closeness(weights=weight_attr)
         times['CLO'] = time.time() - start_time
-        ut.saveGraph(g, g_path)
+        store.save('CLO', g.vs['CLO'], times['CLO'])
     
     if 'DEG' in metrics and 'DEG' not in g_attr: 
         print ('Computing Degree...')
         start_time = time.time()
         g.vs['DEG'] = g.vs.degree()
         times['DEG'] = time.time() - start_time
-        ut.saveGraph(g, g_path)
+        store.save('DEG', g.vs['DEG'], times['DEG'])
     
     if 'HC' in metrics and 'HC' not in g_attr:
         print ('Computing HybridRank, this process could be time consuming...')
         start_time = time.time()
         HybridRank(g, directed=False)
         times['HC'] = time.time() - start_time
-        ut.saveGraph(g, g_path)
+        store.save('HC', g.vs['HC'], times['HC'])
     
     if 'sc_score' in metrics and 'sc_score' not in g_attr:
         print ('Computing SC Score...')
         start_time = time.time()
         sc_core(g,0.5)
         times['sc_score'] = time.time() - start_time
-        ut.saveGraph(g, g_path)
+        store.save('sc_score', g.vs['sc_score'], times['sc_score'])
     
     if 'IKS' in metrics: 
-        print ('Computing IKS...')
-        start_time = time.time()
-        IKS(g, directed=False)
-        times['IKS'] = time.time() - start_time
-        ut.saveGraph(g, g_path)
+        if 'iks_e' in g_attr and 'iks_kcore' in g_attr:
+            times['IKS'] = store.time('iks_e')
+        else:
+            print ('Computing IKS...')
+            start_time = time.time()
+            IKS(g, directed=False)
+            times['IKS'] = time.time() - start_time
+            store.save('iks_kcore', g.vs['iks_kcore'], times['IKS'])
+            store.save('iks_e', g.vs['iks_e'], times['IKS'])
         start_time = time.time()    
         IKS_Select(g, spr_size)
         times['IKS2'] = time.time() - start_time
@@ -106,9 +98,15 @@ def calculateMetrics(g,  g_path, metrics, spr_size, weight_attr=None):
     if 'PRP' in metrics: 
         print ('Computing PBSI...')
         start_time = time.time()
-        c_name,_ = checkPrepareCommunities(g)
+        partitions = PartitionStore(g_path + '.partitions')
+        c_name, gks_name = checkPrepareCommunities(g, alg=partitioner, store=partitions)
         start2_time = time.time()
-        ut.saveGraph(g, g_path)
+        entry = partitions.load(partitions.key(g, partitioner))
+        if entry is not None:
+            times['PART'] = entry['time'] + entry['split_time']
+        for attr in (c_name, gks_name):
+            if attr not in g_attr:
+                store.save(attr, g.vs[attr], start2_time - start_time)
         detectSpreaders(g, spr_size, c_name, commSet = None)
         final_time = time.time()
         times['PRP'] = final_time - start_time
@@ -117,32 +115,30 @@ def calculateMetrics(g,  g_path, metrics, spr_size, weight_attr=None):
 
 
 
-def FSS_Experiment(g, g_path, mu, mc, metrics, spr_size):
-    graph_name = 'FSS_'+graph_path[graph_path.rfind("/")+1:graph_path.rfind(".")]+"_spr"+str(spr_size)
-    times = calculateMetrics(g, g_path, metrics, spr_size, weight_attr=None)
+def FSS_Experiment(g, g_path, mu, mc, metrics, spr_size, rel_err=None, max_mc=None, cache=None, workers=1, partitioner='multilevel'):
+    graph_name = 'FSS_'+g_path[g_path.rfind("/")+1:g_path.rfind(".")]+"_spr"+str(spr_size)
+    times = calculateMetrics(g, g_path, metrics, spr_size, weight_attr=None, partitioner=partitioner)
     
-    nodes = list(g.vs)
-    res = {metric:[None,[],'.-'] for metric in metrics}
+    x = np.linspace(.01,.15,15)
+    tasks = []
     for metric in metrics: 
         print ("Processing Metric: " + metric)
-        nodes.sort(key=lambda x: x[metric], reverse=True)
-        seeds = nodes[:spr_size]
-        x = np.linspace(.01,.15,15)
-        for beta in x:
-            spr,_,_ = sim_SIR(g, seeds, beta, mu=mu, mc=mc, verbose=False)
-            res[metric][1].append(spr)
-        res[metric][0] = x
-        # print (res[metric])
+        tasks.append(Task(metric, topK(g.vs[metric], spr_size), x))
+    
+    out = 'plots/'+graph_name+"_mc"+str(mc)
+    results = runTasks(g, tasks, workers, out+".ckpt", g_path, mu=mu, mc=mc, rel_err=rel_err, max_mc=max_mc, cache=cache)
+    res = {}
+    for metric in metrics:
+        r = results[metric]
+        res[metric] = [x, r['spr'], '.-', r['mc'], r['ci']]
         
     degrees = np.array(g.degree())
     degrees_2 = np.power(degrees,2)
     epidemic_threshold = np.average(degrees) / np.average(degrees_2)
     
-    fig = plt.figure(figsize=(6,6)).add_subplot(111)
-    plot(fig, res, keys=metrics, names=metrics, vline = epidemic_threshold)
-    plt.savefig('plots/'+graph_name+"_mc"+str(mc)+".pdf", dpi=300) 
-    ut.save_json('plots/'+graph_name+"_mc"+str(mc)+".json", res)
-    ut.save_json('plots/'+graph_name+"_mc"+str(mc)+"_times.json", times)
+    saveResults(res, out, keys=metrics, vline = epidemic_threshold)
+    ut.save_json(out+"_times.json", times)
+    finish(out+".ckpt")
 
 
 
@@ -151,6 +147,11 @@ if __name__ == "__main__":
     parser.add_argument('-i', help='Graph instance file', dest='graph_path')
     parser.add_argument('-mu', type=float, help='spreading probability', dest='mu', default=1.0)
     parser.add_argument('-mc', type=int, help='monte carlo simulations', dest='mc', default=32)
+    parser.add_argument('-rel_err', type=float, help='target relative error of the spreading scope (adaptive monte carlo)', dest='rel_err', default=None)
+    parser.add_argument('-max_mc', type=int, help='maximum monte carlo simulations when -rel_err is given', dest='max_mc', default=None)
+    parser.add_argument('-cache', help='directory of the persistent SIR results cache', dest='cache', default=None)
+    parser.add_argument('-workers', type=int, help='simulations run in parallel', dest='workers', default=1)
+    parser.add_argument('-partitioner', choices=sorted(PARTITIONERS), help='community detection used by PBSI', dest='partitioner', default='multilevel')
     parser.add_argument('-spr', type=int, help='Number of Spreaders', dest='spr_size', default=50)
     parser.add_argument('-metrics', nargs='+', type=str, default=['PRP'], dest='metrics')
     
@@ -160,14 +161,19 @@ if __name__ == "__main__":
     mc = args.mc
     spr_size = args.spr_size
     metrics = args.metrics
+    rel_err = args.rel_err
+    max_mc = args.max_mc
+    cache = SIRCache(args.cache) if args.cache else None
+    workers = args.workers
+    partitioner = args.partitioner
     
     if graph_path != None:
-        if os.path.exists(graph_path):
+        if ut.graphExists(graph_path):
             g = ut.openGraph(graph_path)
             if 'name' not in g.vs.attribute_names():
                 g.vs['name'] = ['a'+str(v.index) for v in g.vs]
             # metrics = ['BET', 'CLO', 'DEG',  'HC', 'sc_score', 'IKS', 'VR', 'PRP']
-            FSS_Experiment(g, graph_path, mu, mc, metrics, spr_size)
+            FSS_Experiment(g, graph_path, mu, mc, metrics, spr_size, rel_err, max_mc, cache, workers, partitioner)
         else:
             print ('graph file can not found')
     else: 
@@ -24,69 +24,64 @@
 import os
 import time
 import argparse
-import matplotlib; 
-matplotlib.use('agg')
 import numpy as np 
 from igraph import Graph
 import SprModel.Utilities as ut
-import matplotlib.pyplot as plt
-from SprModel.SIR import sim_SIR 
-from Algorithms.PBSI import detectSpreaders 
-from Algorithms.SpreadersAlgs import voteRank, IKS_Select 
+from SprModel.SIRCache import SIRCache
+from SprModel.MetricStore import MetricStore
+from SprModel.Ranking import Ranking
+from Algorithms.PBSI import detectSpreadersMulti, checkPrepareCommunities
+from Algorithms.Partitions import PartitionStore, PARTITIONERS
+from Algorithms.SpreadersAlgs import voteRankOrder, IKS_Select 
+from ExpRunner import Task, runTasks, saveResults, finish
 
 
 
-def plot(fig, data, keys=[], names=[], title="", xylabels=['',''], flag=True, vline=None):
-    ymax = 0
-    for k in keys:
-        fig.plot(data[k][0], data[k][1], data[k][2], markersize=1)
-        ymax = max(ymax, max(data[k][1]))
-    if flag:
-        fig.set_title(title, fontsize=12)
-        fig.set_xlabel(xylabels[0], fontsize=10)
-        fig.set_ylabel(xylabels[1], fontsize=10)
-        fig.legend(names, fontsize=10, loc=7)
-        fig.grid()
-    if vline:
-        fig.vlines(vline, 0, ymax, colors='k', linestyles='dashed')
-
-
-def FSS_Varing_SPR(g, g_path, betas, mu, mc, metrics, spr_sizes):
-    c_name = 'MLC'
-    nodes = list(g.vs)
+def FSS_Varing_SPR(g, g_path, betas, mu, mc, metrics, spr_sizes, rel_err=None, max_mc=None, cache=None, workers=1,
+                   partitioner='multilevel'):
+    x = np.linspace(spr_sizes[0], spr_sizes[1], spr_sizes[2])
+    if 'PRP' in metrics:
+        c_name, _ = checkPrepareCommunities(g, alg=partitioner, store=PartitionStore(g_path + '.partitions'))
+        prp, prp_offsets = detectSpreadersMulti(g, x.astype(int), c_name)
+    if 'VR' in metrics:
+        print ('Computing VoteRank with r = ' + str(int(x.max())))
+        vr, _ = voteRankOrder(g, directed=False, r = int(x.max()))
     
-    for beta in betas:
-        graph_name = 'FSS2_'+g_path[g_path.rfind("/")+1:g_path.rfind(".")]+"_beta"+str(beta)
-        
-        res = {metric:[None,[],'.-'] for metric in metrics}
-        x = np.linspace(spr_sizes[0], spr_sizes[1], spr_sizes[2])
-        for metric in metrics:
+    tasks = []
+    for metric in metrics:
+        if metric not in ('PRP', 'VR', 'IKS'):
+            ranking = Ranking(g.vs[metric], int(x.max()))
+        for j, spr_size in enumerate(x):
+            spr_size = int(spr_size)
+            print ("Processing Metric: " + metric + "\t spr_size: " + str(spr_size))
             
-            for spr_size in x:
-                spr_size = int(spr_size)
-                print ("Processing Metric: " + metric + "\t spr_size: " + str(spr_size) + "\t beta: " + str(beta))
-                if metric == 'PRP': 
-                    detectSpreaders(g, spr_size, c_name, commSet = None)
-                
-                if  metric == 'VR':
-                    print ('Computing VoteRank with r = ' + str(spr_size))
-                    voteRank(g, directed=False, r = spr_size)
-                
-                if metric == 'IKS':
-                    print ('Computing IKS with spr = ' + str(spr_size))
-                    IKS_Select(g, spr_size)
-                
-                nodes.sort(key=lambda x: x[metric], reverse=True)
-                seeds = nodes[:spr_size]
-                spr,_,_ = sim_SIR(g, seeds, beta, mu=mu, mc=mc, verbose=False)
-                res[metric][1].append(spr)
-            res[metric][0] = x
-            # print (res[metric])
-        
-        fig = plt.figure(figsize=(6,6)).add_subplot(111)
-        plot(fig, res, keys=metrics, names=metrics, vline = None)
-        plt.savefig('plots/'+graph_name+"_mc"+str(mc)+".pdf", dpi=300) 
-        ut.save_json('plots/'+graph_name+"_mc"+str(mc)+".json", res)
+            if metric == 'IKS':
+                print ('Computing IKS with spr = ' + str(spr_size))
+                IKS_Select(g, spr_size)
+                ranking = Ranking(g.vs[metric])
+            
+            if metric == 'PRP':
+                seeds = prp[prp_offsets[j]:prp_offsets[j+1]][:spr_size]
+            elif metric == 'VR':
+                seeds = vr[:spr_size]
+            else:
+                seeds = ranking.top(spr_size)
+            tasks.append(Task((metric, j), seeds, betas))
+    
+    g_name = g_path[g_path.rfind("/")+1:g_path.rfind(".")]
+    checkpoint = 'plots/FSS2_'+g_name+"_mc"+str(mc)+".ckpt"
+    results = runTasks(g, tasks, workers, checkpoint, g_path, mu=mu, mc=mc, rel_err=rel_err, max_mc=max_mc, cache=cache)
+    for i, beta in enumerate(betas):
+        graph_name = 'FSS2_'+g_name+"_beta"+str(beta)
+        res = {metric:[x,[],'.-',[],[]] for metric in metrics}
+        for metric in metrics:
+            for j in range(len(x)):
+                r = results[(metric, j)]
+                res[metric][1].append(r['spr'][i])
+                res[metric][3].append(r['mc'][i])
+                res[metric][4].append(r['ci'][i])
+        saveResults(res, 'plots/'+graph_name+"_mc"+str(mc), keys=metrics)
+    finish(checkpoint)
 
 
 # -i graphs/PGP.graphml -mc 100 -mu 1.0 -betas 0.07 0.10 0.13 -spr 1 100 20
@@ -96,6 +91,11 @@ if __name__ == "__main__":
     parser.add_argument('-i', help='Graph instance file', dest='graph_path')
     parser.add_argument('-mu', type=float, help='spreading probability', dest='mu', default=1.0)
     parser.add_argument('-mc', type=int, help='monte carlo simulations', dest='mc', default=32)
+    parser.add_argument('-rel_err', type=float, help='target relative error of the spreading scope (adaptive monte carlo)', dest='rel_err', default=None)
+    parser.add_argument('-max_mc', type=int, help='maximum monte carlo simulations when -rel_err is given', dest='max_mc', default=None)
+    parser.add_argument('-cache', help='directory of the persistent SIR results cache', dest='cache', default=None)
+    parser.add_argument('-workers', type=int, help='simulations run in parallel', dest='workers', default=1)
+    parser.add_argument('-partitioner', choices=sorted(PARTITIONERS), help='community detection used by PBSI', dest='partitioner', default='multilevel')
     parser.add_argument('-betas', nargs='+', type=float, default=[0.07,0.10,0.13], dest='betas')
     parser.add_argument('-spr', nargs=3, type=int, default=[1,100,20], dest='spr_sizes')
     parser.add_argument('-metrics', nargs='+', type=str, default=['PRP'], dest='metrics')
@@ -107,14 +107,20 @@ if __name__ == "__main__":
     mc = args.mc
     spr_sizes = args.spr_sizes
     metrics = args.metrics
+    rel_err = args.rel_err
+    max_mc = args.max_mc
+    cache = SIRCache(args.cache) if args.cache else None
+    workers = args.workers
+    partitioner = args.partitioner
     
     if graph_path != None:
-        if os.path.exists(graph_path):
+        if ut.graphExists(graph_path):
             g = ut.openGraph(graph_path)
+            MetricStore(g, graph_path).attach(g)
             if 'name' not in g.vs.attribute_names():
                 g.vs['name'] = ['a'+str(v.index) for v in g.vs]
             # metrics = ['BET', 'CLO', 'DEG',  'HC', 'sc_score', 'IKS', 'VR', 'PRP']
-            FSS_Varing_SPR(g, graph_path, betas, mu, mc, metrics, spr_sizes)
+            FSS_Varing_SPR(g, graph_path, betas, mu, mc, metrics, spr_sizes, rel_err, max_mc, cache, workers, partitioner)
         else:
             print ('graph file can not found')
     else: 
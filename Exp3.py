@@ -23,80 +23,107 @@
 
 import os
 import argparse
-import matplotlib; 
-matplotlib.use('agg')
 import numpy as np 
-import matplotlib.pyplot as plt
 import SprModel.Utilities as ut
-from Algorithms.PBSI import detectSpreaders
-from Algorithms.SpreadersAlgs import voteRank, HybridRank, IKS_Select 
+from SprModel.MetricStore import MetricStore
+from SprModel.Ranking import Ranking
+from Algorithms.PBSI import detectSpreadersMulti, checkPrepareCommunities
+from Algorithms.Partitions import PartitionStore, PARTITIONERS
+from Algorithms.SpreadersAlgs import voteRankOrder, HybridRank, IKS_Select 
+from ExpRunner import saveResults
+from SprModel.CSRGraph import toCSR, bfsDistances
 
 
-def plot(fig, data, keys=[], names=[], title="", xylabels=['',''], flag=True, vline=None):
-    ymax = 0
-    for k in keys:
-        fig.plot(data[k][0], data[k][1], data[k][2], markersize=1)
-        ymax = max(ymax, max(data[k][1]))
-    if flag:
-        fig.set_title(title, fontsize=12)
-        fig.set_xlabel(xylabels[0], fontsize=10)
-        fig.set_ylabel(xylabels[1], fontsize=10)
-        fig.legend(names, fontsize=10, loc=7)
-        fig.grid()
-    if vline:
-        fig.vlines(vline, 0, ymax, colors='k', linestyles='dashed')
-
+class SeedDispersion:
+    '''
+    average hop distance between the seeds of a set (LS). The distances between every seed
+    seen so far are kept in a growing k x k matrix: a new seed costs one BFS over the CSR
+    graph, stopped once all the known seeds are reached. When a set extends the previous
+    one (prefix sweeps) only the pairs of the new seeds are added to the running sum
+    '''
+    def __init__(self, g):
+        self.indptr, self.indices = toCSR(g)
+        N = len(self.indptr) - 1
+        self.row = np.full(N, -1, dtype=np.int64)
+        self.known = np.zeros(N, dtype=bool)
+        self.dist = np.full(N, -1, dtype=np.int64)
+        self.D = np.zeros((0, 0))
+        self.k = 0
+        self.last = []
+        self.total = 0.
+    
+    def _add(self, v):
+        if self.k == len(self.D):
+            D = np.full((max(16, 2*self.k),)*2, np.inf)
+            D[:self.k,:self.k] = self.D[:self.k,:self.k]
+            self.D = D
+        reached, d = bfsDistances(self.indptr, self.indices, v, self.dist, stop=self.known)
+        mask = self.known[reached]
+        rows = self.row[reached[mask]]
+        self.D[self.k, rows] = self.D[rows, self.k] = d[mask]
+        self.D[self.k, self.k] = 0
+        self.row[v] = self.k
+        self.known[v] = True
+        self.k += 1
+    
+    def LS(self, seeds):
+        seeds = [getattr(v, 'index', v) for v in seeds]
+        for v in seeds:
+            if not self.known[v]:
+                self._add(v)
+        rows = self.row[seeds]
+        n = len(self.last)
+        if seeds[:n] == self.last and n:
+            new = rows[n:]
+            self.total += self.D[np.ix_(rows[:n], new)].sum() + np.triu(self.D[np.ix_(new, new)], 1).sum()
+        else:
+            self.total = np.triu(self.D[np.ix_(rows, rows)], 1).sum()
+        self.last = seeds
+        if len(seeds) == 1:
+            return 1
+        return self.total / (len(seeds) * (len(seeds) - 1) / 2.)
 
-# -i graphs/PGP.graphml -mc 100 -mu 1.0 -betas 0.07 0.10 0.13 -spr 1 100 20
 
 def LS(g, seeds):
-    if len(seeds) == 1:
-        return 1
-    else:
-        paths = []
-        while(len(seeds) > 0):
-            spr = seeds.pop()
-            for w in seeds:
-                paths.append( g.shortest_paths(source=spr['name'], target=w['name'], weights=None, mode='ALL') )
-        paths = np.array(paths + paths)
-        return np.average(paths)
-    
+    return SeedDispersion(g).LS(seeds)
 
 
-def avg_sht_pat(g, g_path, metrics, spr_sizes):
-    c_name = 'MLC'
-    nodes = list(g.vs)
+def avg_sht_pat(g, g_path, metrics, spr_sizes, partitioner='multilevel'):
     graph_name = 'JS_'+g_path[g_path.rfind("/")+1:g_path.rfind(".")]
     res = {metric:[None,[],'.-'] for metric in metrics}
+    dispersion = SeedDispersion(g)
     
     x = np.linspace(spr_sizes[0], spr_sizes[1], spr_sizes[2])
+    if 'PRP' in metrics:
+        c_name, _ = checkPrepareCommunities(g, alg=partitioner, store=PartitionStore(g_path + '.partitions'))
+        prp, prp_offsets = detectSpreadersMulti(g, x.astype(int), c_name)
+    if 'VR' in metrics:
+        print ('Computing VoteRank with r = ' + str(int(x.max())))
+        vr, _ = voteRankOrder(g, directed=False, r = int(x.max()))
     for metric in metrics:
-        for spr_size in x:
+        if metric not in ('PRP', 'VR', 'IKS'):
+            ranking = Ranking(g.vs[metric], int(x.max()))
+        for j, spr_size in enumerate(x):
             spr_size = int(spr_size)
             print ("Processing Metric: " + metric + "    with spr_size: " + str(spr_size))
             
-            if metric == 'PRP': 
-                detectSpreaders(g, spr_size, c_name, commSet = None)
-            
-            if  metric == 'VR':
-                print ('Computing VoteRank with r = ' + str(spr_size))
-                voteRank(g, directed=False, r = spr_size)
-            
             if metric == 'IKS':
                 print ('Computing IKS with spr = ' + str(spr_size))
                 IKS_Select(g, spr_size)
+                ranking = Ranking(g.vs[metric])
             
-            nodes.sort(key=lambda x: x[metric], reverse=True)
-            seeds = nodes[:spr_size]
-            avg_paths = LS(g, seeds)
+            if metric == 'PRP':
+                seeds = [g.vs[v] for v in prp[prp_offsets[j]:prp_offsets[j+1]][:spr_size]]
+            elif metric == 'VR':
+                seeds = [g.vs[v] for v in vr[:spr_size]]
+            else:
+                seeds = ranking.top(spr_size)
+            avg_paths = dispersion.LS(seeds)
             res[metric][1].append(avg_paths)
         res[metric][0] = x
         print (res[metric])
     
-    fig = plt.figure(figsize=(6,6)).add_subplot(111)
-    plot(fig, res, keys=metrics, names=metrics, vline = None)
-    plt.savefig('plots/'+graph_name+"_spr_"+str(spr_sizes[0])+"-"+str(spr_sizes[1])+".pdf", dpi=300) 
-    ut.save_json('plots/'+graph_name+"_spr_"+str(spr_sizes[0])+"-"+str(spr_sizes[1])+".json", res)
+    saveResults(res, 'plots/'+graph_name+"_spr_"+str(spr_sizes[0])+"-"+str(spr_sizes[1]), keys=metrics)
 
 
 
@@ -105,19 +132,22 @@ if __name__ == "__main__":
     parser.add_argument('-i', help='Graph instance file', dest='graph_path')
     parser.add_argument('-spr', nargs=3, type=int, default=[1,100,20], dest='spr_sizes')
     parser.add_argument('-metrics', nargs='+', type=str, default=['PRP'], dest='metrics')
+    parser.add_argument('-partitioner', choices=sorted(PARTITIONERS), help='community detection used by PBSI', dest='partitioner', default='multilevel')
     
     args = parser.parse_args()
     graph_path = args.graph_path
     spr_sizes = args.spr_sizes
     metrics = args.metrics
+    partitioner = args.partitioner
     
     if graph_path != None:
-        if os.path.exists(graph_path):
+        if ut.graphExists(graph_path):
             g = ut.openGraph(graph_path)
+            MetricStore(g, graph_path).attach(g)
             if 'name' not in g.vs.attribute_names():
                 g.vs['name'] = ['a'+str(v.index) for v in g.vs]
             # metrics = ['BET', 'CLO', 'DEG',  'HC', 'sc_score', 'IKS', 'VR', 'PRP']
-            avg_sht_pat(g, graph_path, metrics, spr_sizes)
+            avg_sht_pat(g, graph_path, metrics, spr_sizes, partitioner)
         else:
             print ('graph file can not found')
     else: 
@@ -22,30 +22,16 @@
 """
 
 import os
-import operator
 import argparse
-import matplotlib; 
-matplotlib.use('agg')
-import matplotlib.pyplot as plt
 import SprModel.Utilities as ut
-from SprModel.SIR import sim_SIR
-from Algorithms.PBSI import __G, checkPrepareCommunities
+from SprModel.SIRCache import SIRCache
+from SprModel.MetricStore import MetricStore
+from SprModel.Ranking import topK
+from Algorithms.PBSI import __G, checkPrepareCommunities, communityIndex
+from Algorithms.Partitions import PartitionStore, PARTITIONERS
 from Algorithms.SpreadersAlgs import voteRank, HybridRank, IKS, IKS_Select, sc_core
-
-
-def plot(fig, data, keys=[], names=[], title="", xylabels=['',''], flag=True, vline=None):
-    ymax = 0
-    for k in keys:
-        fig.plot(data[k][0], data[k][1], data[k][2], markersize=5)
-        ymax = max(ymax, max(data[k][1]))
-    if flag:
-        fig.set_title(title, fontsize=12)
-        fig.set_xlabel(xylabels[0], fontsize=10)
-        fig.set_ylabel(xylabels[1], fontsize=10)
-        fig.legend(names, fontsize=10, loc=7)
-        fig.grid()
-    if vline:
-        fig.vlines(vline, 0, ymax, colors='k', linestyles='dashed')
+from SprModel.CSRGraph import toCSR, eccentricity
+from ExpRunner import Task, runTasks, saveResults, finish
 
 
 def calculateMetrics(g, metrics, spr_size, weight_attr=None):
@@ -68,7 +54,8 @@ def calculateMetrics(g, metrics, spr_size, weight_attr=None):
         return g.vs.degree()
     
     if 'ECC' in metrics:
-        return g.eccentricity()
+        indptr, indices = toCSR(g)
+        return eccentricity(indptr, indices)[0].astype(float).tolist()
     
     if 'VR' in metrics:
         return voteRank(g, directed=False, r = spr_size)
@@ -95,44 +82,34 @@ def computeMetric(g, c_name, metric, spr_size):
     if c_name == None:
         c_name = 'MLC'
     
-    communities = {c:0 for c in set(g.vs[c_name])}
-    for v in g.vs:
-        communities[ v[c_name] ] += 1
-    sorted_comm = sorted(communities.items(), key=operator.itemgetter(1), reverse=False)
-    comm, _ = zip(*sorted_comm)
-    
+    index = communityIndex(g, c_name)
     if metric+'_'+c_name not in set(g.vs.attribute_names()):
-        g.vs[metric + '_' + c_name] = None
-        for c in comm:
-            topics = g.vs.select(lambda x:x[c_name] == c)
-            sub_g = g.subgraph(topics.indices)
+        column = [None]*len(g.vs)
+        for c in index.by_size:
+            sub_g, parent = ut.inducedSubgraph(g, index.top(c))
             m_values = calculateMetrics(sub_g, [metric], spr_size, weight_attr=None)
-            sub_g.vs[metric +'_' + c_name] = m_values
-            for v in sub_g.vs:
-                w = g.vs.select(name=v['name'])
-                w[metric +'_' + c_name] = v[metric +'_' + c_name]
+            for i, value in zip(parent.tolist(), m_values):
+                column[i] = value
+        g.vs[metric + '_' + c_name] = column
     return metric +'_' + c_name, c_name
 
 
 def detectSpreaders(g, alg, metric):
-    gks_name = metric
-    comms_set = set(g.vs[alg])
-    spr = []
-    for c in comms_set: 
-        topics = g.vs.select(lambda x:x[alg] == c)
-        vertices = list(topics)
-        vertices.sort(key = lambda v: v[gks_name], reverse=True)
-        spr.append( vertices[:1][0] )
-    return spr
+    index = communityIndex(g, alg, metric)
+    return [g.vs[index.top(c, 1)[0]] for c in range(len(index.labels))]
 
 
-def FSS_Experiment(g, g_path, mu, beta, mc, metrics, spr_size):
+def FSS_Experiment(g, g_path, mu, beta, mc, metrics, spr_size=None, rel_err=None, max_mc=None, cache=None, workers=1,
+                   partitioner='multilevel'):
+    '''
+    spr_size defaults to the number of communities found by partitioner
+    '''
+    c_name, _ = checkPrepareCommunities(g, alg=partitioner, store=PartitionStore(g_path + '.partitions'))
+    if spr_size is None:
+        spr_size = len(set(g.vs[c_name]))
     graph_name = 'FSS_'+g_path[g_path.rfind("/")+1:g_path.rfind(".")]+"_spr"+str(spr_size)
-    if 'MLC' not in g.vs.attribute_names():
-        checkPrepareCommunities(g, 'MLC')
-    nodes = list(g.vs)
-    res = {metric:[None,[],'.-'] for metric in metrics if metric != "PRP"}
     x = [beta]
+    tasks = []
     for metric in metrics: 
         if metric != 'PRP':
             print ("Processing Metric: " + metric)
@@ -143,31 +120,22 @@ def FSS_Experiment(g, g_path, mu, beta, mc, metrics, spr_size):
             if  metric == 'VR':
                 voteRank(g, directed=False, r = spr_size)
             
-            nodes.sort(key=lambda x: x[metric], reverse=True)
-            seeds = nodes[:spr_size]
-            for b in x:
-                print ("x: " + str(b))
-                spr,_,_ = sim_SIR(g, seeds, b, mu=mu, mc=mc, verbose=False)
-                res[metric][1].append(spr)
-            res[metric][0] = x
-            print (res[metric])
+            tasks.append(Task(metric, topK(g.vs[metric], spr_size), x))
         print ("Processing v2 of Metric: " + metric)
-        metric2,_ = computeMetric(g, None, metric, 1)
-        seeds = detectSpreaders(g, 'MLC', metric2)
+        metric2,_ = computeMetric(g, c_name, metric, 1)
+        tasks.append(Task(metric2, detectSpreaders(g, c_name, metric2), x))
         del g.vs[metric2]
-        res[metric2]=[None,[],'.-']
-        for b in x:
-            print ("x: " + str(b))
-            spr,_,_ = sim_SIR(g, seeds, b, mu=mu, mc=mc, verbose=False)
-            res[metric2][1].append(spr)
-        res[metric2][0] = x
-        print (res[metric2])
-    
-    metrics = sorted(res.keys())
-    fig = plt.figure(figsize=(6,6)).add_subplot(111)
-    plot(fig, res, keys=metrics, names=metrics, vline = None)
-    plt.savefig('plots/'+graph_name+"_mc"+str(mc)+".pdf", dpi=300) 
-    ut.save_json('plots/'+graph_name+"_mc"+str(mc)+".json", res)
+    
+    out = 'plots/'+graph_name+"_mc"+str(mc)
+    results = runTasks(g, tasks, workers, out+".ckpt", g_path, mu=mu, mc=mc, rel_err=rel_err, max_mc=max_mc, cache=cache)
+    res = {}
+    for task in tasks:
+        r = results[task.label]
+        res[task.label] = [x, r['spr'], '.-', r['mc'], r['ci']]
+        print (task.label, res[task.label])
+    
+    saveResults(res, out, markersize=5)
+    finish(out+".ckpt")
     print ("number of spreaders = " + str(spr_size))
 
 
@@ -177,6 +145,11 @@ if __name__ == "__main__":
     parser.add_argument('-beta', type=float, help='spreading probability', dest='beta', default=0.5)
     parser.add_argument('-mu', type=float, help='spreading probability', dest='mu', default=1.0)
     parser.add_argument('-mc', type=int, help='monte carlo simulations', dest='mc', default=32)
+    parser.add_argument('-rel_err', type=float, help='target relative error of the spreading scope (adaptive monte carlo)', dest='rel_err', default=None)
+    parser.add_argument('-max_mc', type=int, help='maximum monte carlo simulations when -rel_err is given', dest='max_mc', default=None)
+    parser.add_argument('-cache', help='directory of the persistent SIR results cache', dest='cache', default=None)
+    parser.add_argument('-workers', type=int, help='simulations run in parallel', dest='workers', default=1)
+    parser.add_argument('-partitioner', choices=sorted(PARTITIONERS), help='community detection used by PBSI', dest='partitioner', default='multilevel')
     parser.add_argument('-metrics', nargs='+', type=str, default=['PRP'], dest='metrics')
     # parser.add_argument('-metrics', nargs='+', type=str, default=['PRP', 'BET', 'CLO', 'DEG', 'VR', 'HC'], dest='metrics')
     
@@ -186,15 +159,20 @@ if __name__ == "__main__":
     mu = args.mu
     mc = args.mc
     metrics = args.metrics
+    rel_err = args.rel_err
+    max_mc = args.max_mc
+    cache = SIRCache(args.cache) if args.cache else None
+    workers = args.workers
+    partitioner = args.partitioner
     
     if graph_path != None:
-        if os.path.exists(graph_path):
+        if ut.graphExists(graph_path):
             g = ut.openGraph(graph_path)
+            MetricStore(g, graph_path).attach(g)
             if 'name' not in g.vs.attribute_names():
                 g.vs['name'] = ['a'+str(v.index) for v in g.vs]
-            spr_size = len(set(g.vs['MLC']))
             # metrics = ['BET', 'CLO', 'DEG',  'HC', 'sc_score', 'IKS', 'VR', 'PRP']
-            FSS_Experiment(g, graph_path, mu, beta, mc, metrics, spr_size)
+            FSS_Experiment(g, graph_path, mu, beta, mc, metrics, None, rel_err, max_mc, cache, workers, partitioner)
         else:
             print ('graph file can not found')
     else: 
@@ -0,0 +1,201 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+
+"""
+    Copyright (c) 2021, Jedidiah Yanez-Sierra, Cinvestav-Guadalajara
+    All rights reserved.
+    Redistribution and use in source and binary forms, with or without modification, are permitted provided that the
+    following conditions are met:
+    * Redistributions of source code must retain the above copyright notice, this list of conditions and the following
+      disclaimer.
+    * Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the
+      following disclaimer in the documentation and/or other materials provided with the distribution.
+    * Neither the name of Cinvestav-Guadalajara nor the names of its contributors may be used to endorse or
+      promote products derived from this software without specific prior written permission.
+    THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+    INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+    DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+    SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+    SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+    WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF
+    THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import os
+import json
+import hashlib
+import multiprocessing as mp
+import matplotlib; 
+matplotlib.use('agg')
+import numpy as np 
+import matplotlib.pyplot as plt
+import SprModel.Utilities as ut
+from SprModel.SIR import sim_SIR
+from SprModel.GraphCache import readGraphCache, cacheFingerprint
+
+
+def plot(fig, data, keys=[], names=[], title="", xylabels=['',''], flag=True, vline=None, markersize=1):
+    ymax = 0
+    for k in keys:
+        fig.plot(data[k][0], data[k][1], data[k][2], markersize=markersize)
+        ymax = max(ymax, max(data[k][1]))
+    if flag:
+        fig.set_title(title, fontsize=12)
+        fig.set_xlabel(xylabels[0], fontsize=10)
+        fig.set_ylabel(xylabels[1], fontsize=10)
+        fig.legend(names, fontsize=10, loc=7)
+        fig.grid()
+    if vline:
+        fig.vlines(vline, 0, ymax, colors='k', linestyles='dashed')
+
+
+def saveResults(res, path, keys=None, vline=None, markersize=1):
+    '''
+    write the res dict as path.pdf (plot of every key) and path.json
+    '''
+    keys = sorted(res.keys()) if keys is None else keys
+    fig = plt.figure(figsize=(6,6)).add_subplot(111)
+    plot(fig, res, keys=keys, names=keys, vline=vline, markersize=markersize)
+    plt.savefig(path+".pdf", dpi=300) 
+    plt.close('all')
+    ut.save_json(path+".json", res)
+
+
+class Task:
+    '''
+    one point of the grid: the seed ids of a (metric, point) label to be simulated for every
+    beta of betas
+    '''
+    def __init__(self, label, seeds, betas):
+        self.label = label
+        self.seeds = [int(getattr(v, 'index', v)) for v in seeds]
+        self.betas = [float(b) for b in betas]
+    
+    def cost(self):
+        return len(self.seeds) * len(self.betas)
+
+
+def seedSetKey(seeds):
+    '''
+    canonical id of a seed set: hash of its sorted distinct vertex ids
+    '''
+    ids = np.unique(np.asarray([int(getattr(v, 'index', v)) for v in seeds], dtype=np.int64))
+    return hashlib.sha1(ids.tobytes()).hexdigest()
+
+
+def _uniqueTasks(tasks):
+    '''
+    one task per distinct seed set, labeled by its seedSetKey, covering every beta asked for
+    that set by any task
+    '''
+    unique = {}
+    for task in tasks:
+        key = seedSetKey(task.seeds)
+        if key not in unique:
+            unique[key] = Task(key, sorted(set(task.seeds)), [])
+        unique[key].betas = sorted(set(unique[key].betas) | set(task.betas))
+    return unique
+
+
+_worker = {'g': None, 'path': None}
+
+def _initWorker(g, path=None):
+    '''
+    with path the worker reads the graph from the binary cache of path instead of receiving
+    g, and the SIR engines map its adjacency from there (see sim_SIR graph_path)
+    '''
+    _worker['g'] = readGraphCache(path) if g is None else g
+    _worker['path'] = path
+
+
+def _simulate(job):
+    key, task, sim_args = job
+    g = _worker['g']
+    spr,_,_,info = sim_SIR(g, [g.vs[v] for v in task.seeds], task.betas, full_output=True,
+                           graph_path=_worker['path'], **sim_args)
+    return key, {'spr': np.asarray(spr).tolist(), 'mc': np.asarray(info['mc']).tolist(),
+                 'ci': np.asarray(info['ci']).tolist()}
+
+
+def _taskKey(fingerprint, task, sim_args):
+    params = sorted((k, v) for k, v in sim_args.items() if k != 'cache')
+    return hashlib.sha1(repr((fingerprint, task.label, task.seeds, task.betas, params)).encode()).hexdigest()
+
+
+def _readCheckpoint(path):
+    done = {}
+    if path is not None and os.path.exists(path):
+        with open(path) as f:
+            lines = f.read().split('\n')
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue # empty, or cut short by an interruption
+            done[record['key']] = record['result']
+        if lines[-1]:
+            with open(path, 'a') as f:
+                f.write('\n')
+    return done
+
+
+def runTasks(g, tasks, workers=1, checkpoint=None, graph_path=None, **sim_args):
+    '''
+    simulate every task with sim_SIR(..., **sim_args) on a pool of workers processes, largest
+    tasks first. Tasks are first reduced to distinct seed sets (see seedSetKey), so every
+    (seed set, beta) pair is simulated once however many labels select it. Each finished
+    simulation is appended to the checkpoint file (JSON lines keyed by the graph fingerprint,
+    the seed set, the betas and sim_args), those found there are not simulated again, so an
+    interrupted run resumes where it stopped. graph_path is the file g was read from: when
+    its binary cache holds the same topology, workers open the graph from the cache instead
+    of receiving a pickled copy of g. Returns {label: {'spr', 'mc', 'ci'}}, one entry per beta
+    of the task
+    '''
+    fingerprint = ut.graphFingerprint(g)
+    if graph_path is not None and cacheFingerprint(graph_path) != fingerprint:
+        graph_path = None
+    unique = _uniqueTasks(tasks)
+    keys = dict((k, _taskKey(fingerprint, task, sim_args)) for k, task in unique.items())
+    done = _readCheckpoint(checkpoint)
+    jobs = [(keys[k], task, sim_args) for k, task in unique.items() if keys[k] not in done]
+    jobs.sort(key=lambda job: job[1].cost(), reverse=True)
+    points = sum(len(task.betas) for task in tasks)
+    distinct = sum(len(task.betas) for task in unique.values())
+    print ('%d tasks (%d points): %d distinct seed sets (%d points), %d simulations skipped as '
+           'duplicates, %d seed sets from checkpoint' % (len(tasks), points, len(unique), distinct,
+           points - distinct, len(unique) - len(jobs)))
+    
+    if workers > 1 and len(jobs) > 1:
+        initargs = (None, graph_path) if graph_path is not None else (g, None)
+        pool = mp.Pool(min(workers, len(jobs)), initializer=_initWorker, initargs=initargs)
+        results = pool.imap_unordered(_simulate, jobs)
+    else:
+        pool = None
+        _initWorker(g, graph_path)
+        results = (_simulate(job) for job in jobs)
+    try:
+        for key, result in results:
+            done[key] = result
+            if checkpoint is not None:
+                with open(checkpoint, 'a') as f:
+                    f.write(json.dumps({'key': key, 'result': result}) + '\n')
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    
+    results = {}
+    for task in tasks:
+        k = seedSetKey(task.seeds)
+        result, index = done[keys[k]], unique[k].betas.index
+        results[task.label] = dict((field, [result[field][index(b)] for b in task.betas])
+                                   for field in ('spr', 'mc', 'ci'))
+    return results
+
+
+def finish(checkpoint):
+    '''
+    drop the checkpoint of a run once its outputs are written
+    '''
+    if checkpoint is not None and os.path.exists(checkpoint):
+        os.remove(checkpoint)
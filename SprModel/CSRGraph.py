@@ -0,0 +1,257 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+
+"""
+    Copyright (c) 2021, Jedidiah Yanez-Sierra, Cinvestav-Guadalajara
+    All rights reserved.
+    Redistribution and use in source and binary forms, with or without modification, are permitted provided that the
+    following conditions are met:
+    * Redistributions of source code must retain the above copyright notice, this list of conditions and the following
+      disclaimer.
+    * Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the
+      following disclaimer in the documentation and/or other materials provided with the distribution.
+    * Neither the name of Cinvestav-Guadalajara nor the names of its contributors may be used to endorse or
+      promote products derived from this software without specific prior written permission.
+    THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+    INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+    DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+    SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+    SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+    WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF
+    THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import numpy as np
+import scipy.sparse as sps
+
+
+class CSRGraph:
+    '''
+    array view of a graph for the array-native algorithms: CSR adjacencies (one per mode,
+    built on first use) and vertex metrics as contiguous numpy columns. Columns are read
+    from the igraph attributes, or from the binary cache when built from a path, on first
+    access; columns set here are only written back to the igraph Graph by sync()
+    '''
+    def __init__(self, g=None, path=None, mmap_mode='r'):
+        self.g = g
+        self.path = path
+        self.mmap_mode = mmap_mode
+        self.csrs = {}
+        self.cores = {}
+        self.columns = {}
+        self.dirty = set()
+        if g is not None:
+            self.N, self.directed = len(g.vs), g.is_directed()
+        else:
+            from .GraphCache import loadMeta
+            meta = loadMeta(path)
+            if meta is None:
+                raise IOError('no binary cache for ' + str(path))
+            self.N, self.directed = meta['N'], meta['directed']
+    
+    def graph(self):
+        '''
+        the igraph Graph, read from the binary cache the first time when built from a path
+        '''
+        if self.g is None:
+            from .GraphCache import readGraphCache
+            self.g = readGraphCache(self.path)
+        return self.g
+    
+    def csr(self, mode='ALL'):
+        mode = mode.upper() if self.directed else 'ALL'
+        if mode not in self.csrs:
+            if self.g is None and mode == 'ALL':
+                from .GraphCache import loadCSR
+                self.csrs[mode] = loadCSR(self.path, self.mmap_mode)
+            else:
+                self.csrs[mode] = toCSR(self.graph(), mode)
+        return self.csrs[mode]
+    
+    def degree(self, mode='ALL'):
+        return np.diff(self.csr(mode)[0])
+    
+    def adjacency(self, mode='ALL', dtype=np.int32):
+        return adjacencyMatrix(*self.csr(mode), dtype=dtype)
+    
+    def coreness(self, mode='ALL'):
+        mode = mode.upper() if self.directed else 'ALL'
+        if mode not in self.cores:
+            self.cores[mode] = np.array(self.graph().coreness(mode=mode), dtype=np.int64)
+        return self.cores[mode]
+    
+    def __contains__(self, name):
+        try:
+            self[name]
+        except KeyError:
+            return False
+        return True
+    
+    def __getitem__(self, name):
+        if name not in self.columns:
+            if self.g is not None and name in self.g.vs.attribute_names():
+                self.columns[name] = np.asarray(self.g.vs[name])
+            else:
+                from .GraphCache import loadColumn
+                column = loadColumn(self.path, name, self.mmap_mode) if self.path else None
+                if column is None:
+                    raise KeyError(name)
+                self.columns[name] = column
+        return self.columns[name]
+    
+    def __setitem__(self, name, values):
+        self.columns[name] = np.asarray(values)
+        self.dirty.add(name)
+    
+    def sync(self, names=None):
+        '''
+        write the columns set since the last sync (or names) to the igraph vertex attributes
+        '''
+        g = self.graph()
+        for name in (sorted(self.dirty) if names is None else names):
+            g.vs[name] = self.columns[name].tolist()
+            self.dirty.discard(name)
+        return g
+
+
+def toCSR(g, mode='ALL', simple=False):
+    '''
+    build the CSR adjacency (indptr, indices) of g, neighbors are sorted by index. Multiple
+    edges keep one entry each, as igraph neighbors(); with simple, self-loops are dropped
+    and every neighbor is listed once (the SIR engines, one infection trial per neighbor)
+    '''
+    edges = np.array(g.get_edgelist(), dtype=np.int64).reshape(-1, 2)
+    if not g.is_directed() or mode.upper() == 'ALL':
+        return csrFromEdges(len(g.vs), edges[:,0], edges[:,1], simple=simple)
+    elif mode.upper() == 'OUT':
+        return csrFromEdges(len(g.vs), edges[:,0], edges[:,1], directed=True, simple=simple)
+    return csrFromEdges(len(g.vs), edges[:,1], edges[:,0], directed=True, simple=simple)
+
+
+def csrFromEdges(N, src, dst, directed=False, simple=False):
+    '''
+    CSR adjacency of the N vertices graph with edges src[i] -> dst[i] (both ways if undirected),
+    without self-loops and repeated (src, dst) pairs when simple
+    '''
+    if not directed:
+        src, dst = np.concatenate((src, dst)), np.concatenate((dst, src))
+    order = np.lexsort((dst, src))
+    src, dst = np.asarray(src)[order], np.asarray(dst)[order]
+    if simple:
+        keep = src != dst
+        keep[1:] &= (src[1:] != src[:-1]) | (dst[1:] != dst[:-1])
+        src, dst = src[keep], dst[keep]
+    indices = dst.astype(np.int32)
+    indptr = np.zeros(N+1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=N), out=indptr[1:])
+    return indptr, indices
+
+
+def gatherNeighbors(indptr, indices, vs):
+    '''
+    concatenated neighbor lists of the vertices in vs, plus the degree of each one
+    '''
+    starts = indptr[vs]
+    deg = indptr[vs+1] - starts
+    total = deg.sum()
+    pos = np.arange(total, dtype=np.int64) + np.repeat(starts - (np.cumsum(deg) - deg), deg)
+    return indices[pos], deg
+
+
+def edgeArrays(indptr, indices):
+    '''
+    undirected edge list (u < v) of a CSR adjacency, sorted by (u, v)
+    '''
+    src = np.repeat(np.arange(len(indptr)-1, dtype=np.int32), np.diff(indptr))
+    mask = src < indices
+    return src[mask], indices[mask]
+
+
+def adjacencyMatrix(indptr, indices, dtype=np.int32):
+    '''
+    scipy sparse (CSR) adjacency matrix sharing the CSR arrays
+    '''
+    N = len(indptr) - 1
+    return sps.csr_matrix((np.ones(len(indices), dtype=dtype), indices, indptr), shape=(N, N))
+
+
+def bfsDistances(indptr, indices, source, dist=None, stop=None):
+    '''
+    level-synchronous BFS from source, returns the reached vertices and their hop distances.
+    dist is an optional scratch array filled with -1, it is left as found. With a boolean
+    array stop, the search ends as soon as every flagged vertex is reached
+    '''
+    if dist is None:
+        dist = np.full(len(indptr)-1, -1, dtype=np.int64)
+    frontier = np.array([source], dtype=np.int64)
+    dist[source] = 0
+    levels = [frontier]
+    remaining = None if stop is None else int(stop.sum()) - int(stop[source])
+    while len(frontier) and remaining != 0:
+        targets, _ = gatherNeighbors(indptr, indices, frontier)
+        frontier = np.unique(targets[dist[targets] < 0])
+        dist[frontier] = len(levels)
+        levels.append(frontier)
+        if remaining is not None:
+            remaining -= int(stop[frontier].sum())
+    reached = np.concatenate(levels)
+    d = dist[reached]
+    dist[reached] = -1
+    return reached, d
+
+
+def eccentricity(indptr, indices, eps=0., samples=None, random_seed=None):
+    '''
+    eccentricities of a symmetric CSR adjacency by bounding (Takes & Kosters): every BFS from a
+    source s with eccentricity e(s) bounds the vertices v it reaches by
+        max(e(s) - d(s,v), d(s,v)) <= e(v) <= e(s) + d(s,v)
+    and vertices whose bounds meet need no BFS of their own. Degree-1 vertices are pruned: the
+    leaves hanging from the same vertex share their eccentricity, so only the first one is
+    kept (it still serves as a source) and the others copy its value at the end. With eps=0
+    the sources alternate between the largest upper and the smallest lower bound and the
+    result is exact. With eps>0 every third source is sampled at random among the unsettled
+    vertices instead, a vertex settles once its upper bound is within (1+eps) of its lower
+    bound and the lower bound is returned, at most 'samples' BFS are run if given. Returns
+    the eccentricities and the number of BFS used
+    '''
+    N = len(indptr) - 1
+    deg = np.diff(indptr)
+    lower = np.zeros(N, dtype=np.int64)
+    upper = np.full(N, N, dtype=np.int64)
+    leaves = np.flatnonzero(deg == 1)
+    parent = indices[indptr[leaves]]
+    leaves, parent = leaves[deg[parent] > 1], parent[deg[parent] > 1]
+    first = np.full(N, N, dtype=np.int64)
+    np.minimum.at(first, parent, leaves)
+    leaves, kept = leaves[first[parent] != leaves], first[parent[first[parent] != leaves]]
+    pruned = np.zeros(N, dtype=bool)
+    pruned[leaves] = True
+    active = ~pruned
+    dist = np.full(N, -1, dtype=np.int64)
+    rng = np.random.RandomState(random_seed)
+    
+    bfs = 0
+    cycle = 3 if eps > 0 else 2
+    while active.any():
+        if samples is not None and bfs >= samples:
+            break
+        if bfs % cycle == 2:
+            candidates = np.flatnonzero(active)
+            s = candidates[rng.randint(len(candidates))]
+        else:
+            # largest upper / smallest lower bound, ties to the lowest degree (peripheral
+            # vertices give the tightest lower bounds on real-world graphs)
+            # among the vertices not settled exactly, an eps-settled one can still be the best source
+            bound = upper if bfs % cycle == 0 else N - lower
+            unsettled = (upper > lower) & ~pruned
+            s = np.where(unsettled if unsettled.any() else active, bound * (N + 1) + (N - deg), -1).argmax()
+        
+        reached, d = bfsDistances(indptr, indices, s, dist)
+        bfs += 1
+        e = d[-1]
+        lower[reached] = np.maximum(lower[reached], np.maximum(e - d, d))
+        upper[reached] = np.minimum(upper[reached], e + d)
+        active[reached] = upper[reached] > (1. + eps) * lower[reached]
+        active[pruned] = False
+    lower[leaves] = lower[kept]
+    return lower, bfs
@@ -0,0 +1,201 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+
+"""
+    Copyright (c) 2021, Jedidiah Yanez-Sierra, Cinvestav-Guadalajara
+    All rights reserved.
+    Redistribution and use in source and binary forms, with or without modification, are permitted provided that the
+    following conditions are met:
+    * Redistributions of source code must retain the above copyright notice, this list of conditions and the following
+      disclaimer.
+    * Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the
+      following disclaimer in the documentation and/or other materials provided with the distribution.
+    * Neither the name of Cinvestav-Guadalajara nor the names of its contributors may be used to endorse or
+      promote products derived from this software without specific prior written permission.
+    THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+    INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+    DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+    SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+    SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+    WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF
+    THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import os
+import json
+import hashlib
+import numpy as np
+from igraph import Graph
+from .CSRGraph import toCSR, csrFromEdges
+
+
+# Binary cache of a graph file, kept in the directory <path>.cache next to it:
+#     edges.npy                edge list in igraph edge order (E x 2)
+#     indptr.npy, indices.npy  CSR adjacency (mode ALL, sorted neighbors)
+#     indptr_simple.npy, ...   the same without self-loops and repeated neighbors (SIR engines),
+#                              only written when it differs from the CSR above
+#     v_<i>.npy, e_<i>.npy     vertex / edge attribute columns (numeric, bool or fixed width str)
+#     meta.json                vertex count, direction, attribute names and graph attributes
+# meta.json is written last, a cache without it (or older than the source) is not used.
+# All arrays are plain .npy files so they can be memory mapped by many processes.
+
+
+def cachePath(path):
+    return path + '.cache'
+
+
+def isFresh(path):
+    '''
+    True when the cache of path exists and is newer than path (or path does not exist)
+    '''
+    meta = os.path.join(cachePath(path), 'meta.json')
+    if not os.path.exists(meta):
+        return False
+    return not os.path.exists(path) or os.path.getmtime(meta) >= os.path.getmtime(path)
+
+
+def _column(values):
+    '''
+    attribute values as a storable array, None when they are not homogeneous
+    '''
+    if any(v is None for v in values):
+        return None
+    column = np.array(values)
+    if column.dtype.kind not in 'biufU':
+        return None
+    return column
+
+
+def _save(directory, name, array):
+    np.save(os.path.join(directory, name + '.npy'), np.ascontiguousarray(array))
+
+
+def writeGraphCache(g, path, csr=None):
+    '''
+    write the binary cache of g for the graph file path, returns False (writing nothing) when
+    some attribute can not be stored as a column
+    '''
+    columns = {'v': [], 'e': []}
+    for prefix, seq in (('v', g.vs), ('e', g.es)):
+        for attr in seq.attribute_names():
+            column = _column(seq[attr])
+            if column is None:
+                return False
+            columns[prefix].append((attr, column))
+    try:
+        graph_attrs = dict((a, g[a]) for a in g.attributes())
+        json.dumps(graph_attrs)
+    except (TypeError, ValueError):
+        return False
+    
+    edges = np.array(g.get_edgelist(), dtype=np.int32).reshape(-1, 2)
+    writeCacheArrays(path, len(g.vs), edges, g.is_directed(), columns['v'], columns['e'],
+                     graph_attrs, csr if csr is not None else toCSR(g))
+    return True
+
+
+def writeCacheArrays(path, N, edges, directed=False, vertex=(), edge=(), graph_attrs=None, csr=None):
+    '''
+    write the cache of the graph file path from arrays: the N vertices graph with edges
+    (E x 2, igraph edge order), vertex / edge columns as (name, array) pairs and graph
+    attributes; the graph file itself does not need to exist
+    '''
+    directory = cachePath(path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    meta_path = os.path.join(directory, 'meta.json')
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+    
+    if csr is None:
+        csr = csrFromEdges(N, edges[:,0], edges[:,1], directed=directed)
+    _save(directory, 'edges', edges)
+    _save(directory, 'indptr', csr[0])
+    _save(directory, 'indices', csr[1])
+    simple = csrFromEdges(N, edges[:,0], edges[:,1], simple=True)
+    is_simple = np.array_equal(simple[0], csr[0]) and np.array_equal(simple[1], csr[1])
+    if not is_simple:
+        _save(directory, 'indptr_simple', simple[0])
+        _save(directory, 'indices_simple', simple[1])
+    meta = {'N': int(N), 'directed': bool(directed), 'simple': bool(is_simple), 'graph': graph_attrs or {},
+            'v': [], 'e': []}
+    for prefix, columns in (('v', vertex), ('e', edge)):
+        for attr, column in columns:
+            _save(directory, '%s_%d' % (prefix, len(meta[prefix])), column)
+            meta[prefix].append(attr)
+    
+    with open(meta_path + '.tmp', 'w') as f:
+        json.dump(meta, f)
+    os.replace(meta_path + '.tmp', meta_path)
+
+
+def _load(directory, name, mmap_mode):
+    return np.load(os.path.join(directory, name + '.npy'), mmap_mode=mmap_mode)
+
+
+def readGraphCache(path, mmap_mode=None):
+    '''
+    igraph Graph rebuilt from the cache of path, None when there is no fresh cache
+    '''
+    if not isFresh(path):
+        return None
+    directory = cachePath(path)
+    with open(os.path.join(directory, 'meta.json')) as f:
+        meta = json.load(f)
+    
+    edges = _load(directory, 'edges', mmap_mode)
+    g = Graph(n=meta['N'], edges=edges.tolist(), directed=meta['directed'])
+    for attr, value in meta['graph'].items():
+        g[attr] = value
+    for prefix, seq in (('v', g.vs), ('e', g.es)):
+        for i, attr in enumerate(meta[prefix]):
+            seq[attr] = _load(directory, '%s_%d' % (prefix, i), mmap_mode).tolist()
+    return g
+
+
+def loadCSR(path, mmap_mode='r', simple=False):
+    '''
+    CSR adjacency (indptr, indices) of the graph file path straight from its cache, memory
+    mapped by default so that worker processes share the pages, None when there is no fresh
+    cache. simple selects the adjacency without self-loops and repeated neighbors (see toCSR)
+    '''
+    meta = loadMeta(path)
+    if meta is None or (simple and 'simple' not in meta):
+        return None
+    directory = cachePath(path)
+    suffix = '_simple' if simple and not meta['simple'] else ''
+    return _load(directory, 'indptr' + suffix, mmap_mode), _load(directory, 'indices' + suffix, mmap_mode)
+
+
+def cacheFingerprint(path):
+    '''
+    Utilities.graphFingerprint of the graph cached for path, without building it; None when
+    there is no fresh cache
+    '''
+    meta = loadMeta(path)
+    if meta is None:
+        return None
+    h = hashlib.sha1(str(meta['N']).encode())
+    h.update(_load(cachePath(path), 'edges', 'r').astype(np.int64).tobytes())
+    return h.hexdigest()
+
+
+def loadMeta(path):
+    '''
+    meta.json of the cache of path (vertex count, direction, attribute names), None when
+    there is no fresh cache
+    '''
+    if not isFresh(path):
+        return None
+    with open(os.path.join(cachePath(path), 'meta.json')) as f:
+        return json.load(f)
+
+
+def loadColumn(path, attr, mmap_mode='r'):
+    '''
+    a single vertex attribute column from the cache of path, None if it is not cached
+    '''
+    meta = loadMeta(path)
+    if meta is None or attr not in meta['v']:
+        return None
+    return _load(cachePath(path), 'v_%d' % meta['v'].index(attr), mmap_mode)
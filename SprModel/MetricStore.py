@@ -0,0 +1,110 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+
+"""
+    Copyright (c) 2021, Jedidiah Yanez-Sierra, Cinvestav-Guadalajara
+    All rights reserved.
+    Redistribution and use in source and binary forms, with or without modification, are permitted provided that the
+    following conditions are met:
+    * Redistributions of source code must retain the above copyright notice, this list of conditions and the following
+      disclaimer.
+    * Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the
+      following disclaimer in the documentation and/or other materials provided with the distribution.
+    * Neither the name of Cinvestav-Guadalajara nor the names of its contributors may be used to endorse or
+      promote products derived from this software without specific prior written permission.
+    THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+    INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+    DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+    SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+    SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+    WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF
+    THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import os
+import json
+import numpy as np
+from .Utilities import graphFingerprint
+
+
+class MetricStore:
+    '''
+    per graph store of vertex metrics, one array per metric, kept in the append-only file
+    <graph path>.metrics. Every record is a JSON header line (metric name, graph fingerprint,
+    compute time, dtype, length, size) followed by the raw array; records of other
+    fingerprints are ignored and the last record of a name wins. Opening only reads the
+    headers, arrays are read on first use
+    '''
+    def __init__(self, g, path):
+        self.path = path + '.metrics'
+        self.fingerprint = graphFingerprint(g)
+        self.index = {}
+        self.arrays = {}
+        self.end = None
+        if os.path.exists(self.path):
+            self._scan()
+    
+    def _scan(self):
+        size = os.path.getsize(self.path)
+        with open(self.path, 'rb') as f:
+            while True:
+                end = f.tell()
+                line = f.readline()
+                if not line.endswith(b'\n'):
+                    break
+                header = json.loads(line.decode('utf-8'))
+                offset = f.tell()
+                if offset + header['nbytes'] > size:
+                    break
+                f.seek(header['nbytes'], 1)
+                if header['fingerprint'] == self.fingerprint:
+                    self.index[header['name']] = (offset, header)
+        if end < size:
+            self.end = end # tail cut short by an interrupted write, dropped on the next save
+    
+    def __contains__(self, name):
+        return name in self.index
+    
+    def names(self):
+        return list(self.index)
+    
+    def time(self, name):
+        '''
+        recorded compute time of name in seconds, 0 if it is not stored
+        '''
+        return self.index[name][1]['time'] if name in self.index else 0
+    
+    def load(self, name):
+        if name not in self.arrays:
+            offset, header = self.index[name]
+            with open(self.path, 'rb') as f:
+                f.seek(offset)
+                data = f.read(header['nbytes'])
+            self.arrays[name] = np.frombuffer(data, dtype=np.dtype(header['dtype']), count=header['length'])
+        return self.arrays[name]
+    
+    def save(self, name, values, time=0.):
+        values = np.ascontiguousarray(values)
+        if values.dtype.kind not in 'biufU':
+            raise ValueError('metric ' + name + ' is not a numeric or string column')
+        header = {'name': name, 'fingerprint': self.fingerprint, 'time': float(time),
+                  'dtype': values.dtype.str, 'length': len(values), 'nbytes': values.nbytes}
+        if self.end is not None:
+            with open(self.path, 'r+b') as f:
+                f.truncate(self.end)
+            self.end = None
+        with open(self.path, 'ab') as f:
+            f.write((json.dumps(header) + '\n').encode('utf-8'))
+            offset = f.tell()
+            f.write(values.tobytes())
+        self.index[name] = (offset, header)
+        self.arrays[name] = values
+    
+    def attach(self, g, names=None):
+        '''
+        set the stored metrics (all of them by default) missing in g as vertex attributes
+        '''
+        present = set(g.vs.attribute_names())
+        for name in (self.names() if names is None else names):
+            if name in self.index and name not in present:
+                g.vs[name] = self.load(name).tolist()
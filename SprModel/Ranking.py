@@ -0,0 +1,78 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+
+"""
+    Copyright (c) 2021, Jedidiah Yanez-Sierra, Cinvestav-Guadalajara
+    All rights reserved.
+    Redistribution and use in source and binary forms, with or without modification, are permitted provided that the
+    following conditions are met:
+    * Redistributions of source code must retain the above copyright notice, this list of conditions and the following
+      disclaimer.
+    * Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the
+      following disclaimer in the documentation and/or other materials provided with the distribution.
+    * Neither the name of Cinvestav-Guadalajara nor the names of its contributors may be used to endorse or
+      promote products derived from this software without specific prior written permission.
+    THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+    INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+    DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+    SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+    SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+    WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF
+    THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import numpy as np
+
+
+def _key(values):
+    '''
+    sort key of a metric column: ascending key is decreasing value, NaN (e.g. the closeness
+    of an isolated vertex) ranks last
+    '''
+    values = np.asarray(values)
+    if values.dtype.kind in 'biu':
+        return -values.astype(np.int64)
+    key = -values.astype(np.float64)
+    key[np.isnan(key)] = np.inf
+    return key
+
+
+def topK(values, k):
+    '''
+    indices of the k largest values in decreasing order, ties to the lowest index. Only the k
+    selected entries are sorted: the k-th largest value is found by a partial selection and
+    the tied entries at the boundary are taken by increasing index
+    '''
+    key = _key(values)
+    k = max(0, min(int(k), len(key)))
+    if k == 0:
+        return np.zeros(0, dtype=np.int64)
+    if k == len(key):
+        return np.argsort(key, kind='stable')
+    t = np.partition(key, k-1)[k-1]
+    above = np.flatnonzero(key < t)
+    tied = np.flatnonzero(key == t)[:k - len(above)]
+    top = np.concatenate((above, tied))
+    return top[np.lexsort((top, key[top]))]
+
+
+class Ranking:
+    '''
+    ordering of the vertices by decreasing value of a metric, ties to the lowest index, so
+    every prefix is the same for a given column. The largest prefix computed so far is cached
+    and smaller prefixes are slices of it: the first query (or k, the largest size a sweep
+    needs) takes a partial selection, a larger query falls back to one full stable argsort
+    '''
+    def __init__(self, values, k=None):
+        self.values = np.asarray(values)
+        self.order = None
+        if k is not None:
+            self.top(k)
+    
+    def top(self, k):
+        k = max(0, min(int(k), len(self.values)))
+        if self.order is None:
+            self.order = topK(self.values, k)
+        elif k > len(self.order):
+            self.order = np.argsort(_key(self.values), kind='stable')
+        return self.order[:k]
@@ -21,7 +21,14 @@
     THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 """
 
+import atexit
+import hashlib
 import numpy as np
+import multiprocessing as mp
+import scipy.stats as sp
+import scipy.sparse as sps
+from .CSRGraph import toCSR, gatherNeighbors, edgeArrays, adjacencyMatrix
+from .GraphCache import loadCSR
 
 class SIR:
     def __init__(self, graph, beta=0.3, mu=0.08, seed=[]):
@@ -112,27 +119,405 @@ class SIR:
         return self.peak_time
 
 
-def sim_SIR(g, seed=[], beta=0.3, mu=0.08, num_steps=1, random_seed=None, mc = 32, verbose=False):
+class FastSIR(SIR):
     '''
-    perform multiple realization of a SIR simulation
+    array-backed SIR, same dynamics as SIR but on a CSR adjacency and an int8 state vector
     '''
+    S, I, R = 0, 1, 2
+    
+    def __init__(self, graph, beta=0.3, mu=0.08, seed=[], csr=None):
+        if csr is None:
+            csr = toCSR(graph, simple=True)
+        self.g = graph
+        self.indptr, self.indices = csr
+        self.N = len(self.indptr) - 1
+        self.BETA = beta  # infection rate
+        self.MU = mu      # recovery rate
+        self.keys=['t', 'S', 'I', 'R', 'SI', 'IR']
+        self.data_normalized = { k: [] for k in self.keys}
+        self.attack_rate=0.0
+        self.peak_time=0.0
+        self.seed=seed
+    
+    def run(self, num_steps=1, random_seed=None, rng=None):
+        self.data = { k: [] for k in self.keys }
+        
+        if rng is None:
+            if random_seed != None:
+                print ('Working with fixed random_seed: ' + str(random_seed))
+            rng = np.random.default_rng(random_seed)
+        
+        if not len(self.seed):
+            self.seed = [int(rng.integers(self.N))]
+        
+        infected = np.unique([getattr(v, 'index', v) for v in self.seed]).astype(np.int64)
+        state = np.zeros(self.N, dtype=np.int8)
+        state[infected] = self.I
+        counts = [self.N - len(infected), len(infected), 0, len(infected), 0]
+        t = 0
+        
+        while True:
+            if t % num_steps == 0:
+                self.data['t'].append(t)
+                for k, c in zip(self.keys[1:], counts):
+                    self.data[k].append(c)
+            
+            if not len(infected):
+                self.attack_rate=float(self.data["R"][-1])/self.N
+                ii=np.argmax(self.data["I"])
+                self.peak_time=self.data["t"][ii]
+                self.data_normalized = {k: [float(v) / self.N for v in self.data[k]] for k in self.data if k not in ["t"]}
+                break
+            
+            # TRANSMISSION, one Bernoulli trial per S-I edge
+            targets, _ = gatherNeighbors(self.indptr, self.indices, infected)
+            targets = targets[state[targets] == self.S]
+            targets = targets[rng.random(len(targets)) < self.BETA]
+            new = np.unique(targets)
+            
+            # RECOVERY, one Bernoulli trial per infectious node
+            recovered = rng.random(len(infected)) < self.MU
+            n_new, n_rec = len(new), int(recovered.sum())
+            
+            state[new] = self.I
+            state[infected[recovered]] = self.R
+            infected = np.concatenate((infected[~recovered], new))
+            counts = [counts[0] - n_new, counts[1] + n_new - n_rec, counts[2] + n_rec, n_new, n_rec]
+            t += 1
+        return self.data, self.data_normalized
+
+
+def _percolationScope(edges, N, seed, rng):
+    '''
+    Newman-Ziff pass: spreading scope of seed after each one of the E edges of a random
+    permutation is occupied, i.e. the size of the union of the clusters holding a seed
+    '''
+    parent = list(range(N))
+    size = [1]*N
+    seeded = [False]*N
+    for s in seed:
+        seeded[s] = True
+    scope = len(seed)
+    curve = [scope]
+    for e in rng.permutation(len(edges)):
+        u, v = edges[e]
+        while parent[u] != u:
+            parent[u] = parent[parent[u]]
+            u = parent[u]
+        while parent[v] != v:
+            parent[v] = parent[parent[v]]
+            v = parent[v]
+        if u != v:
+            if size[u] < size[v]:
+                u, v = v, u
+            parent[v] = u
+            if seeded[u] != seeded[v]:
+                scope += size[v] if seeded[u] else size[u]
+                seeded[u] = True
+            size[u] += size[v]
+        curve.append(scope)
+    return curve
+
+
+def _replicaRNG(entropy, i):
+    '''
+    independent generator of the i-th realization, derived from the root seed entropy
+    '''
+    return np.random.default_rng(np.random.SeedSequence(entropy, spawn_key=(i,)))
+
+
+def _runReplicas(csr, seed, beta, mu, num_steps, entropy, start, stop):
+    sir = FastSIR(None, beta, mu, seed, csr=csr)
+    return [sir.run(num_steps, rng=_replicaRNG(entropy, i))[0] for i in range(start, stop)]
+
+
+def _runLockstep(csr, seed, beta, mu, num_steps, entropy, start, stop):
+    '''
+    advance the realizations [start, stop) together: the states form a (replicas x N) int8
+    matrix and the number of infectious neighbors of every node comes from one sparse
+    product per step; returns one data dictionary per realization, as SIR.run
+    '''
+    S, I, R = FastSIR.S, FastSIR.I, FastSIR.R
+    rng = np.random.default_rng(np.random.SeedSequence(entropy, spawn_key=(start, stop)))
+    A = adjacencyMatrix(*csr)
+    reps, N = stop - start, A.shape[0]
+    state = np.zeros((reps, N), dtype=np.int8)
+    state[:, seed] = I
+    
+    counts = [np.full(reps, N - len(seed)), np.full(reps, len(seed)), np.zeros(reps, dtype=np.int64),
+              np.full(reps, len(seed)), np.zeros(reps, dtype=np.int64)]
+    series = []
+    while True:
+        series.append(np.array(counts))
+        if not counts[1].any():
+            break
+        
+        # TRANSMISSION, a susceptible node with m infectious neighbors is infected w.p. 1-(1-beta)^m
+        r, c = np.nonzero(state == I)
+        X = sps.csr_matrix((np.ones(len(r), dtype=np.int32), (r, c)), shape=(reps, N))
+        P = (X * A).tocoo()
+        susceptible = state[P.row, P.col] == S
+        rr, cc, m = P.row[susceptible], P.col[susceptible], P.data[susceptible]
+        hit = rng.random(len(m)) < 1 - (1 - beta)**m
+        
+        # RECOVERY
+        recovered = rng.random(len(r)) < mu
+        
+        state[rr[hit], cc[hit]] = I
+        state[r[recovered], c[recovered]] = R
+        n_new = np.bincount(rr[hit], minlength=reps)
+        n_rec = np.bincount(r[recovered], minlength=reps)
+        counts = [counts[0] - n_new, counts[1] + n_new - n_rec, counts[2] + n_rec, n_new, n_rec]
+    
+    series = np.array(series)
+    end = np.argmax(series[:, 1, :] == 0, axis=0)
+    keys = ['S', 'I', 'R', 'SI', 'IR']
+    datas = []
+    for j in range(reps):
+        data = {'t': list(range(0, end[j]+1, num_steps))}
+        for k in range(len(keys)):
+            data[keys[k]] = series[0:end[j]+1:num_steps, k, j].tolist()
+        datas.append(data)
+    return datas
+
+
+def _runPercolation(csr, seed, entropy, betas, start, stop):
+    '''
+    spreading scope of each realization in [start, stop) at every beta, as the scope curve
+    weighted by the binomial distribution of occupied edges (see _binomialWindows) over the
+    edges actually permuted, i.e. without self-loops and multiple edges
+    '''
+    edges = list(zip(*[e.tolist() for e in edgeArrays(*csr)]))
+    N = len(csr[0]) - 1
+    windows = _binomialWindows(len(edges), betas)
+    res = []
+    for i in range(start, stop):
+        curve = np.array(_percolationScope(edges, N, seed, _replicaRNG(entropy, i)), dtype=float)
+        res.append([np.dot(curve[lo:lo+len(w)], w) for lo, w in windows])
+    return res
+
+
+_worker_csr = None
+
+def _initWorker(csr, path=None):
+    '''
+    with path the worker maps the adjacency from the binary cache of path, so every worker
+    shares the same pages, otherwise it keeps the copy of csr it received
+    '''
+    global _worker_csr
+    _worker_csr = loadCSR(path, 'r', simple=True) if path is not None else csr
+
+
+def _workerTask(task):
+    func, args = task
+    return func(_worker_csr, *args)
+
+
+_pool = {'key': None, 'pool': None}
+
+def _getPool(csr, workers, path=None):
+    '''
+    process pool whose workers got the CSR adjacency csr once, at start-up (mapped from the
+    cache of path when given, see _initWorker); it is kept alive while the following calls
+    use the same adjacency (by content, so a graph edited in place gets a new pool) and
+    number of workers
+    '''
+    h = hashlib.sha1(np.ascontiguousarray(csr[0]).tobytes())
+    h.update(np.ascontiguousarray(csr[1]).tobytes())
+    key = (h.hexdigest(), workers, path)
+    if _pool['key'] != key:
+        closePool()
+        initargs = (None, path) if path is not None else (csr, None)
+        _pool['pool'] = mp.Pool(workers, initializer=_initWorker, initargs=initargs)
+        _pool['key'] = key
+    return _pool['pool']
+
+
+def closePool():
+    if _pool['pool'] is not None:
+        _pool['pool'].terminate()
+        _pool['pool'] = None
+        _pool['key'] = None
+
+atexit.register(closePool)
+
+
+def _mappedCSR(g, graph_path):
+    '''
+    simple CSR adjacency of g, memory mapped from the binary cache of graph_path when that
+    cache holds the same adjacency, plus the path to map it from (None when it does not)
+    '''
+    csr = toCSR(g, simple=True)
+    mapped = loadCSR(graph_path, 'r', simple=True) if graph_path is not None else None
+    if mapped is None or not all(np.array_equal(a, b) for a, b in zip(csr, mapped)):
+        return csr, None
+    return mapped, graph_path
+
+
+def _mapReplicas(g, func, args, start, stop, workers, graph_path=None):
+    '''
+    run func over the realizations [start, stop), split in chunks across the worker pool;
+    the per-realization results are returned in realization order. With graph_path the
+    workers map the adjacency from its binary cache instead of receiving a copy
+    '''
+    csr, path = _mappedCSR(g, graph_path)
+    if workers <= 1:
+        return func(csr, *(args + (start, stop)))
+    n = stop - start
+    n_chunks = min(n, 4*workers)
+    bounds = [start + n * c // n_chunks for c in range(n_chunks+1)]
+    tasks = [(func, args + (bounds[c], bounds[c+1])) for c in range(n_chunks)]
+    return [r for chunk in _getPool(csr, workers, path).map(_workerTask, tasks) for r in chunk]
+
+
+def _resolveSeed(g, seed, root):
+    if not len(seed):
+        return [int(np.random.default_rng(root).integers(len(g.vs)))]
+    return sorted(set(getattr(v, 'index', v) for v in seed))
+
+
+def _confidence(values, confidence=0.95):
+    '''
+    mean and normal-approximation confidence interval half-width of the mean of values
+    '''
+    values = np.asarray(values, dtype=float)
+    mean = np.mean(values, axis=0)
+    if len(values) < 2:
+        return mean, np.full(np.shape(mean), np.inf)
+    z = sp.norm.ppf(0.5 + confidence / 2.)
+    return mean, z * np.std(values, axis=0, ddof=1) / np.sqrt(len(values))
+
+
+def _monteCarlo(simulate, value, mc, rel_err=None, ci_width=None, max_mc=None, confidence=0.95):
+    '''
+    run simulate(start, stop) by batches of mc realizations; when rel_err (relative to the
+    mean) or ci_width (absolute) is given, stop as soon as the CI half-width of the mean of
+    value(results) meets every given target, or when max_mc (default 10*mc) is reached
+    '''
+    results = simulate(0, mc)
+    if rel_err is None and ci_width is None:
+        return results
+    if max_mc is None:
+        max_mc = 10*mc
+    while len(results) < max_mc:
+        mean, half = _confidence(value(results), confidence)
+        done = np.ones(np.shape(half), dtype=bool)
+        if rel_err is not None:
+            done &= half <= rel_err * np.abs(mean)
+        if ci_width is not None:
+            done &= half <= ci_width
+        if np.all(done):
+            break
+        results += simulate(len(results), min(len(results) + mc, max_mc))
+    return results
+
+
+def _binomialWindows(E, betas):
+    '''
+    binomial pmf of the number of occupied edges for every beta, cut to +-10 std devs
+    '''
+    windows = []
+    for b in betas:
+        std = np.sqrt(E * b * (1 - b))
+        lo = int(max(0, np.floor(E*b - 10*std - 1)))
+        hi = int(min(E, np.ceil(E*b + 10*std + 1)))
+        windows.append((lo, sp.binom.pmf(np.arange(lo, hi+1), E, b)))
+    return windows
+
+
+def sim_SIR_percolation(g, seed=[], betas=[0.1], random_seed=None, mc=32, workers=1,
+                        rel_err=None, ci_width=None, max_mc=None, confidence=0.95, cache=None, graph_path=None):
+    '''
+    expected final spreading scope for every beta in betas when mu = 1.0, where SIR maps
+    exactly onto bond percolation; one union-find pass per realization covers all betas.
+    Returns the spread and normalized spread arrays plus an info dict with the number of
+    realizations used ('mc') and the confidence interval of each point ('ci')
+    '''
+    N = len(g.vs)
+    root = np.random.SeedSequence(random_seed)
+    args = (_resolveSeed(g, seed, root), root.entropy, [float(b) for b in betas])
+    simulate = lambda start, stop: _mapReplicas(g, _runPercolation, args, start, stop, workers, graph_path)
+    if cache is not None and len(seed):
+        key = cache.key(g, seed, 'percolation', tuple(float(b) for b in betas), random_seed)
+        simulate = cache.wrap(key, simulate)
+    scopes = _monteCarlo(simulate, np.array, mc, rel_err, ci_width, max_mc, confidence)
+    
+    spread, half = _confidence(scopes, confidence)
+    info = {'mc': np.full(len(betas), len(scopes)), 'ci': np.column_stack((spread - half, spread + half))}
+    return spread, spread / N, info
+
+
+def _aggregate(datas, N, verbose=False):
     spread=[]
-    spread_norm=[]
     data_avg = None 
-    
-    sir = SIR(g, beta, mu, seed)
-    for i in range(mc):
-        data, data_norm = sir.run(num_steps, random_seed)
-        spread.append(data["R"][-1])         
-        spread_norm.append(data_norm["R"][-1])
+    for i, data in enumerate(datas):
+        spread.append(data["R"][-1])
         if i==0:
-            data_avg = data
+            data_avg = {k: np.array(data[k], dtype=float) for k in data.keys()}
         else:
             for k in data.keys():
                 minL = min(len(data[k]), len(data_avg[k]))
                 data_avg[k] = np.add(data[k][:minL],data_avg[k][:minL])
         if verbose: print (len(data["R"]), data["R"][-1])
-    for k in data.keys():
-        data_avg[k] /= mc
-    return np.mean(spread), np.mean(spread_norm), data_avg
+    for k in data_avg.keys():
+        data_avg[k] /= len(datas)
+    return np.mean(spread), np.mean(spread) / N, data_avg
+
 
+def sim_SIR(g, seed=[], beta=0.3, mu=0.08, num_steps=1, random_seed=None, mc = 32, verbose=False, engine='sets', workers=1,
+            rel_err=None, ci_width=None, max_mc=None, confidence=0.95, full_output=False, cache=None,
+            graph_path=None):
+    '''
+    perform multiple realization of a SIR simulation
+    engine: 'sets' runs the original SIR class, 'csr' the array-backed FastSIR, 'lockstep'
+        advances all realizations together as one matrix simulation in this process
+    workers: number of processes for the 'csr' engine (workers > 1 implies engine='csr');
+        each realization draws from its own stream spawned from random_seed, so results
+        for a given random_seed do not depend on workers
+    adaptive stopping: with rel_err and/or ci_width, mc becomes the batch size and batches
+        are added until the CI of the spreading scope meets the targets or max_mc is reached
+    full_output: also return an info dict with the realizations used ('mc') and the
+        confidence interval of the spreading scope ('ci')
+    cache: SIRCache where realizations are stored and reused, for an explicit seed set
+    graph_path: file g was read from; the array engines then map the adjacency from its
+        binary cache (see GraphCache), shared by all worker processes, when it matches g
+    sweep mode: when beta is a sequence, arrays with one value per beta are returned; with
+    mu = 1.0 the whole sweep is solved by sim_SIR_percolation and data_avg is None
+    '''
+    if np.ndim(beta):
+        if mu == 1.0:
+            spread, spread_norm, info = sim_SIR_percolation(g, seed, beta, random_seed, mc, workers,
+                                                            rel_err, ci_width, max_mc, confidence, cache,
+                                                            graph_path)
+            res = (spread, spread_norm, None)
+        else:
+            res = [sim_SIR(g, seed, b, mu, num_steps, random_seed, mc, verbose, engine, workers,
+                           rel_err, ci_width, max_mc, confidence, True, cache, graph_path) for b in beta]
+            spread, spread_norm, data_avg, infos = zip(*res)
+            info = {'mc': np.array([i['mc'] for i in infos]), 'ci': np.array([i['ci'] for i in infos])}
+            res = (np.array(spread), np.array(spread_norm), list(data_avg))
+        return res + (info,) if full_output else res
+    
+    if engine == 'sets' and workers > 1:
+        engine = 'csr'
+    if engine in ('csr', 'lockstep'):
+        root = np.random.SeedSequence(random_seed)
+        args = (_resolveSeed(g, seed, root), beta, mu, num_steps, root.entropy)
+        if engine == 'lockstep':
+            simulate = lambda start, stop: _mapReplicas(g, _runLockstep, args, start, stop, 1, graph_path)
+        else:
+            simulate = lambda start, stop: _mapReplicas(g, _runReplicas, args, start, stop, workers, graph_path)
+    else:
+        sir = SIR(g, beta, mu, seed)
+        simulate = lambda start, stop: [sir.run(num_steps, random_seed)[0] for i in range(start, stop)]
+    if cache is not None and len(seed):
+        key = cache.key(g, seed, 'SIR', float(beta), float(mu), num_steps, engine, random_seed)
+        simulate = cache.wrap(key, simulate)
+    final = lambda datas: [data["R"][-1] for data in datas]
+    datas = _monteCarlo(simulate, final, mc, rel_err, ci_width, max_mc, confidence)
+    
+    res = _aggregate(datas, len(g.vs), verbose)
+    if not full_output:
+        return res
+    mean, half = _confidence(final(datas), confidence)
+    return res + ({'mc': len(datas), 'ci': np.array([mean - half, mean + half])},)
@@ -0,0 +1,105 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+
+"""
+    Copyright (c) 2021, Jedidiah Yanez-Sierra, Cinvestav-Guadalajara
+    All rights reserved.
+    Redistribution and use in source and binary forms, with or without modification, are permitted provided that the
+    following conditions are met:
+    * Redistributions of source code must retain the above copyright notice, this list of conditions and the following
+      disclaimer.
+    * Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the
+      following disclaimer in the documentation and/or other materials provided with the distribution.
+    * Neither the name of Cinvestav-Guadalajara nor the names of its contributors may be used to endorse or
+      promote products derived from this software without specific prior written permission.
+    THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+    INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+    DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+    SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+    SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+    WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF
+    THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import os
+import pickle
+import hashlib
+from .Utilities import graphFingerprint
+
+
+class SIRCache:
+    '''
+    persistent memo of Monte Carlo realizations, one file per key in path; a key combines
+    the graph fingerprint, the sorted seed ids and the simulation parameters but not mc, so
+    the realizations stored for a small mc are reused and extended by a larger one. Files
+    are evicted least-recently-used first once the directory exceeds max_bytes
+    '''
+    def __init__(self, path, max_bytes=2**30):
+        self.path = path
+        self.max_bytes = max_bytes
+        if not os.path.isdir(path):
+            os.makedirs(path)
+    
+    def key(self, g, seed, *params):
+        '''
+        the topology is hashed on every call, so a graph edited in place gets new keys
+        '''
+        seed = tuple(sorted(set(int(getattr(v, 'index', v)) for v in seed)))
+        return hashlib.sha1(repr((graphFingerprint(g), seed) + params).encode()).hexdigest()
+    
+    def _file(self, key):
+        return os.path.join(self.path, key + '.pkl')
+    
+    def load(self, key):
+        path = self._file(key)
+        try:
+            os.utime(path, None)
+            with open(path, 'rb') as f:
+                return pickle.load(f)
+        except (IOError, OSError):
+            return [] # not stored, or evicted by another process
+    
+    def store(self, key, results):
+        path = self._file(key)
+        with open(path + '.tmp', 'wb') as f:
+            pickle.dump(results, f, protocol=2)
+        os.replace(path + '.tmp', path)
+        self.evict(keep=path)
+    
+    def evict(self, keep=None):
+        '''
+        drop the least recently used files until the store fits in max_bytes; several
+        processes may evict at once, files removed by another one are skipped
+        '''
+        files = []
+        for f in os.listdir(self.path):
+            if f.endswith('.pkl'):
+                f = os.path.join(self.path, f)
+                try:
+                    files.append((os.path.getmtime(f), os.path.getsize(f), f))
+                except OSError:
+                    continue
+        files.sort()
+        total = sum(size for _, size, _ in files)
+        for _, size, f in files:
+            if total <= self.max_bytes:
+                break
+            if f != keep:
+                try:
+                    os.remove(f)
+                except OSError:
+                    pass
+                total -= size
+    
+    def wrap(self, key, simulate):
+        '''
+        simulate(start, stop) backed by the realizations stored under key; only the ones
+        not stored yet are simulated, then appended to the store
+        '''
+        results = self.load(key)
+        def cached(start, stop):
+            if len(results) < stop:
+                results.extend(simulate(len(results), stop))
+                self.store(key, results)
+            return results[start:stop]
+        return cached
@@ -24,38 +24,87 @@
 from __future__ import print_function
 import scipy.stats as sp
 from igraph import Graph
+import os
 import re 
 import sys
 import imp
 import json
+import hashlib
 import numpy as np
+from .GraphCache import readGraphCache, writeGraphCache, isFresh
 
 
-def saveGraph(g, path, verbose=True):
+def saveGraph(g, path, verbose=True, cache=True):
     if verbose:
         print(g.summary())    
         print("Writing to GRAPHML...")
     graph_file_handler = open(path, mode = "w")        
     g.write_graphml(graph_file_handler)
     graph_file_handler.close()   
+    if cache:
+        writeGraphCache(g, path)
         
-def openGraph(path):
+def openGraph(path, cache=True):
+    '''
+    read a GraphML file, through its binary cache (see GraphCache) when it is newer than the
+    file, the cache is (re)written after parsing
+    '''
+    if cache:
+        g = readGraphCache(path)
+        if g is not None:
+            return g
     graph_file_handler = open(path, mode = 'r')
     g = Graph().Read_GraphML(graph_file_handler)
     del g.vs['id']
     graph_file_handler.close()
+    if cache:
+        writeGraphCache(g, path)
     return g
 
 
+def graphExists(path):
+    '''
+    True when the graph file path or a fresh binary cache of it exists
+    '''
+    return os.path.exists(path) or isFresh(path)
+
+
+def inducedSubgraph(g, indices):
+    '''
+    subgraph of g induced by indices, plus the array mapping its vertex ids to ids in g
+    '''
+    parent = np.unique(np.asarray(indices, dtype=np.int64))
+    return g.subgraph(parent.tolist()), parent
+
+
+def setAttribute(g, attr, indices, values, default=None):
+    '''
+    set attr of the vertices indices of g to values with a single attribute assignment
+    '''
+    if attr in g.vs.attribute_names():
+        column = g.vs[attr]
+    else:
+        column = [default]*len(g.vs)
+    for i, value in zip(np.asarray(indices).tolist(), values):
+        column[i] = value
+    g.vs[attr] = column
+
+
+def graphFingerprint(g):
+    '''
+    content hash of the topology of g (vertex count and edge list)
+    '''
+    h = hashlib.sha1(str(len(g.vs)).encode())
+    h.update(np.array(g.get_edgelist(), dtype=np.int64).tobytes())
+    return h.hexdigest()
+
+
 class NumpyEncoder(json.JSONEncoder):
     """ Special json encoder for numpy types """
     def default(self, obj):
-        if isinstance(obj, (np.int_, np.intc, np.intp, np.int8,
-            np.int16, np.int32, np.int64, np.uint8,
-            np.uint16, np.uint32, np.uint64)):
+        if isinstance(obj, np.integer):
             return int(obj)
-        elif isinstance(obj, (np.float_, np.float16, np.float32, 
-            np.float64)):
+        elif isinstance(obj, np.floating):
             return float(obj)
         elif isinstance(obj,(np.ndarray,)): #### This is the fix
             return obj.tolist()
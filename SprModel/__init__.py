@@ -22,4 +22,8 @@
 """
 
 from .SIR import sim_SIR
+from .CSRGraph import CSRGraph
+from .Ranking import Ranking, topK
+from .SIRCache import SIRCache
+from .MetricStore import MetricStore
 from .Utilities import saveGraph, openGraph, save_json, load_json
\ No newline at end of file
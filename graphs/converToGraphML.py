@@ -23,12 +23,104 @@
 
 from __future__ import print_function
 import os
+import sys
 import argparse
+from itertools import islice
+import numpy as np
 from igraph import Graph
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from SprModel.GraphCache import writeCacheArrays
 
 def error():
     print("Unsupported Input Graph") 
 
+
+def readChunks(path, fmt, chunk):
+    '''
+    first two columns of the edge lines of path, chunk lines at a time; comment lines
+    (#, %) and the size line of mtx files are skipped
+    '''
+    header = fmt == 'mtx'
+    with open(path, 'r') as f:
+        while True:
+            lines = list(islice(f, chunk))
+            if not lines:
+                break
+            pairs = []
+            for line in lines:
+                tokens = line.split()
+                if len(tokens) < 2 or tokens[0][0] in '#%':
+                    continue
+                if header:
+                    header = False
+                    continue
+                pairs.append(tokens[:2])
+            if pairs:
+                pairs = np.array(pairs)
+                if fmt == 'edgelist':
+                    pairs = pairs.astype(np.int64)
+                yield pairs
+
+
+def _union(parent, u, v):
+    '''
+    union-find on arrays: hook the larger root of every edge under the smaller one and
+    compress paths until every edge joins a single root
+    '''
+    while True:
+        ru, rv = parent[u], parent[v]
+        mask = ru != rv
+        if not mask.any():
+            return parent
+        np.minimum.at(parent, np.maximum(ru, rv)[mask], np.minimum(ru, rv)[mask])
+        while True:
+            grand = parent[parent]
+            if np.array_equal(grand, parent):
+                break
+            parent = grand
+
+
+def streamConvert(path, fmt, out, chunk=1000000, graphml=False):
+    '''
+    convert the edge list path to an undirected simple graph made of its giant component,
+    without building it in igraph: labels are collected in a first pass, edges are relabeled,
+    stripped of self-loops and duplicates and unioned chunk by chunk in a second one. The
+    binary cache of out (see GraphCache) is always written, the GraphML file only on demand
+    '''
+    labels = None
+    for pairs in readChunks(path, fmt, chunk):
+        chunk_labels = np.unique(pairs)
+        labels = chunk_labels if labels is None else np.union1d(labels, chunk_labels)
+    if labels is None:
+        raise ValueError('no edges found in ' + path)
+    N = len(labels)
+    
+    parent = np.arange(N)
+    keys = []
+    for pairs in readChunks(path, fmt, chunk):
+        ids = np.searchsorted(labels, pairs)
+        u, v = ids.min(axis=1), ids.max(axis=1)
+        u, v = u[u != v], v[u != v]
+        keys.append(np.unique(u * N + v))
+        parent = _union(parent, u, v)
+    keys = np.unique(np.concatenate(keys))
+    u, v = keys // N, keys % N
+    
+    sizes = np.bincount(parent, minlength=N)
+    giant = parent == sizes.argmax()
+    new_id = np.cumsum(giant) - 1
+    mask = giant[u]
+    edges = np.column_stack((new_id[u[mask]], new_id[v[mask]])).astype(np.int32)
+    names = labels[giant].astype(str)
+    print("%d vertices, %d edges in the giant component (%d vertices, %d edges read)" % (len(names), len(edges), N, len(keys)))
+    
+    if graphml:
+        g = Graph(n=len(names), edges=edges.tolist())
+        g.vs['name'] = names.tolist()
+        g.write_graphml(out)
+    writeCacheArrays(out, len(names), edges, vertex=[('name', names)])
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     txt = 'Format of the input graph [EdgeList, NCol, Pajek, mtx]. ' \
@@ -41,6 +133,11 @@ if __name__ == "__main__":
     
     parser.add_argument('-type', type=str, help=txt, dest='GraphFormat')
     parser.add_argument('-i', help='input Graph file', dest='graph_path')
+    parser.add_argument('-o', help='output GraphML path (default: <input name>.graphml in the current directory)', dest='out_path', default=None)
+    parser.add_argument('-stream', action='store_true', help='EdgeList, NCol and mtx only: stream the file in chunks and keep the giant '\
+        'component of the simple undirected graph, writing the binary graph cache used by openGraph', dest='stream')
+    parser.add_argument('-graphml', action='store_true', help='with -stream, also write the GraphML file', dest='graphml')
+    parser.add_argument('-chunk', type=int, help='lines per chunk with -stream', dest='chunk', default=1000000)
     args = parser.parse_args()
     graph_path = args.graph_path
     inputFormat = args.GraphFormat
@@ -50,10 +147,16 @@ if __name__ == "__main__":
     if graph_path != None:
         if os.path.exists(graph_path):
             graph_name = graph_path[graph_path.rfind("/")+1:graph_path.rfind(".")]+".graphml"
-            g = opc.get(inputFormat.lower(), error)(graph_path)
-            g.write_graphml(graph_name)
-            print ("Graph stored as ", graph_name)
+            if args.out_path:
+                graph_name = args.out_path
+            if args.stream and inputFormat.lower() in ('edgelist', 'ncol', 'mtx'):
+                streamConvert(graph_path, inputFormat.lower(), graph_name, args.chunk, args.graphml)
+                print ("Graph stored as ", (graph_name + " and " if args.graphml else "") + graph_name + ".cache")
+            else:
+                g = opc.get(inputFormat.lower(), error)(graph_path)
+                g.write_graphml(graph_name)
+                print ("Graph stored as ", graph_name)
         else:
             print ('graph file can not be found')
     else: 
-        print ('a graph file must be provided')
\ No newline at end of file
+        print ('a graph file must be provided')